@@ -0,0 +1,19 @@
+import os
+
+
+def atomic_write(path, write, mode='w'):
+  """
+  Calls write with a file (opened in mode) that's renamed to path once write is done, so nothing ever reads a
+  half-written file and a run killed halfway through still has the last good copy. The temporary file is this
+  process's own, so other processes writing the same path at the same time can't clobber it; the last to finish wins.
+  """
+  temp = f'{path}.{os.getpid()}.tmp'
+
+  try:
+    with open(temp, mode) as f:
+      write(f)
+    os.replace(temp, path)
+  except BaseException:
+    if os.path.exists(temp):
+      os.remove(temp)
+    raise
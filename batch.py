@@ -0,0 +1,225 @@
+"""
+Solves many mine layouts of the same template at once with NumPy.
+
+Until the solver has to start crossing inequalities, every inequality it holds is just a column/color hint or a
+revealed cell's count with the revealed and flagged cells taken out, so each round boils down to a handful of matrix
+products over the whole batch. Layouts that solve (or fail) within those opening trivial rounds get their results
+straight from here; the rest need the exact/inexact stages and are handed to the scalar solver.
+"""
+
+import numpy
+
+from cellsets import LazyCells
+from templater import Candidate
+
+
+def layouts_to_array(compressed_list):
+  """Turns a list of equal-length compressed strings into a (candidates x cells) uint8 array of their characters"""
+  if not compressed_list:
+    return numpy.zeros((0, 0), dtype=numpy.uint8)
+
+  joined = ''.join(compressed_list).encode('ascii')
+  return numpy.frombuffer(joined, dtype=numpy.uint8).reshape(len(compressed_list), -1)
+
+
+def layouts_to_strings(layouts):
+  return [row.tobytes().decode('ascii') for row in layouts]
+
+
+def sample_layouts(probabilities, rngs):
+  """
+  Draws a layout per rng the way generator.random_compressed does, from the same random numbers: a cell is '.' if its
+  draw is at most its first probability, '*' if at most the first two together, '?' otherwise
+  """
+  probabilities = numpy.asarray(probabilities, dtype=float)
+  draws = numpy.array([[rng.random() for _ in range(len(probabilities))] for rng in rngs]).reshape(len(rngs), -1)
+
+  layouts = numpy.full(draws.shape, ord('?'), dtype=numpy.uint8)
+  layouts[draws <= probabilities[:, 0] + probabilities[:, 1]] = ord('*')
+  layouts[draws <= probabilities[:, 0]] = ord('.')
+  return layouts
+
+
+def one_char_variants(compressed, chars):
+  """
+  Every layout one character off compressed, as (index changed, layouts): cell by cell, each of chars in order except
+  the one already there
+  """
+  layout = layouts_to_array([compressed])[0]
+  codes = numpy.frombuffer(chars.encode('ascii'), dtype=numpy.uint8)
+
+  indexes, replacements = numpy.nonzero(codes[None, :] != layout[:, None])
+  layouts = numpy.repeat(layout[None, :], len(indexes), axis=0)
+  layouts[numpy.arange(len(indexes)), indexes] = codes[replacements]
+  return indexes, layouts
+
+
+def weighted_probabilities(layouts, scores):
+  """
+  Each cell's share of '.' and of '*' among (candidates x cells) layouts, weighted by score, as (cells x 2). The sums
+  are added up one candidate at a time (cumsum, unlike sum, doesn't add pairwise), in the same order as generator.py's
+  loop, so the results are exactly the same, and a cell every candidate agrees on comes out as exactly 0 or 1.
+  """
+  weights = numpy.asarray(scores, dtype=float)
+  chars = numpy.stack([layouts == ord('.'), layouts == ord('*')], axis=-1)
+  return numpy.cumsum(weights[:, None, None] * chars, axis=0)[-1] / numpy.cumsum(weights)[-1]
+
+
+def to_mask(row):
+  """Turns a row of booleans, one per cell, into the cell set's bitmask"""
+  return int.from_bytes(numpy.packbits(row, bitorder='little').tobytes(), 'little')
+
+
+def distinct_rows(masks, present):
+  """Counts the distinct rows among those that are present, per candidate, for (candidates x hints x cells) masks"""
+  packed = numpy.packbits(masks & present[:, :, None], axis=-1)
+  keys = numpy.ascontiguousarray(packed).view(numpy.dtype((numpy.void, packed.shape[-1])))[:, :, 0]
+  keys = numpy.sort(keys, axis=1)
+
+  changes = (keys[:, 1:] != keys[:, :-1]).sum(axis=1) + 1
+  return changes - (~present).any(axis=1)  # the all-zero row that stands in for absent hints isn't a hint
+
+
+class BatchSolver(object):
+  """
+  Precomputes a template's hint membership matrices so that batches of layouts for it can be solved together.
+
+  Takes a templater.Template (board ids must be 0..N-1) and maps each layout onto its board the same way
+  templater.Candidate does, so results match the scalar path exactly. With max_rounds, solves still going after that
+  many rounds are cut short and marked pruned, as the solver does.
+  """
+
+  def __init__(self, template, max_inexact_stages=-1, max_rounds=None):
+    self.template = template
+    self.max_inexact_stages = max_inexact_stages
+    self.max_rounds = max_rounds
+
+    board = template.board
+    revealed = list(template.revealed)
+    constraints = [[0, list(cells)] for cells in template.constraints]
+
+    num = len(board)
+    self.num = num
+
+    self.revealed_mask = numpy.zeros(num, dtype=bool)
+    self.revealed_mask[revealed] = True
+
+    # rows: each constraint as Puzzle.convert_constraints leaves it, then each cell's neighbors
+    self.counted = numpy.zeros((len(constraints), num), dtype=numpy.int32)
+    for row, constraint in enumerate(constraints):
+      numpy.add.at(self.counted[row], constraint[1], 1)
+
+    kept = [row for row in range(len(constraints)) if (self.counted[row].astype(bool) & ~self.revealed_mask).any()]
+    self.constraint_rows = numpy.array(kept, dtype=numpy.intp)
+    constraint_masks = self.counted[kept].astype(bool) & ~self.revealed_mask
+
+    neighbor_masks = numpy.zeros((num, num), dtype=bool)
+    for tile_id, _, neighbors in board:
+      neighbor_masks[tile_id, list(neighbors)] = True
+
+    self.has_neighbors = neighbor_masks.any(axis=1)
+    self.neighbor_counts = neighbor_masks.astype(numpy.int32)
+    self.masks = numpy.vstack([constraint_masks, neighbor_masks])
+    self.matrix = self.masks.astype(numpy.int32)
+    self.num_constraints = len(kept)
+
+  def cell_layouts(self, layouts):
+    """Expands (candidates x compressed) layouts to (candidates x cells) the way replace_cells fills in the board"""
+    board = self.template.board
+    current = numpy.array([ord(what) if what else 0 for _, what, _ in sorted(board)], dtype=numpy.uint8)
+    cells = numpy.repeat(current[None, :], len(layouts), axis=0)
+    cells[:, [cell[0] for cell in board[:layouts.shape[1]]]] = layouts
+    return cells
+
+  def solve(self, layouts):
+    """
+    Solves each row of layouts (as from layouts_to_array), returning the same result dicts the solver would.
+    """
+    layouts = numpy.asarray(layouts, dtype=numpy.uint8)
+    count = len(layouts)
+    cells = self.cell_layouts(layouts)
+
+    mines = cells == ord('*')
+    hint_counts = numpy.hstack([
+      (mines & ~self.revealed_mask).astype(numpy.int32) @ self.counted[self.constraint_rows].T,
+      mines.astype(numpy.int32) @ self.neighbor_counts.T,
+    ])
+    has_hint = (cells == ord('.')) & self.has_neighbors
+
+    revealed = numpy.repeat(self.revealed_mask[None, :], count, axis=0)
+    flagged = numpy.zeros((count, self.num), dtype=bool)
+    summaries = [[] for _ in range(count)]
+    results = [None] * count
+    # a mine on a revealed cell makes its hints contradict each other, and what the scalar solver makes of that
+    # depends on the order it goes through them in, so those layouts are left to it
+    active = numpy.flatnonzero(~(mines & self.revealed_mask).any(axis=1))
+
+    while len(active):
+      known = revealed[active] | flagged[active]
+      present = numpy.hstack([
+        numpy.ones((len(active), self.num_constraints), dtype=bool),
+        revealed[active] & has_hint[active],
+      ])
+
+      # Stage: adjust - what's left of each hint once revealed and flagged cells are taken out
+      unknown = (~known).astype(numpy.int32) @ self.matrix.T
+      remaining = hint_counts[active] - flagged[active].astype(numpy.int32) @ self.matrix.T
+      present &= unknown > 0
+
+      empty = present & (remaining == 0)
+      full = present & (remaining == unknown)
+      num_ineqs = distinct_rows(self.masks[None, :, :] & ~known[:, None, :], present)
+
+      still_active = []
+      for position, candidate in enumerate(active):
+        if not present[position].any():  # nothing left to solve
+          results[candidate] = self.result(True, revealed[candidate], flagged[candidate], summaries[candidate])
+        elif self.max_rounds is not None and len(summaries[candidate]) >= self.max_rounds:  # out of rounds
+          results[candidate] = self.result(False, revealed[candidate], flagged[candidate], summaries[candidate])
+          results[candidate]['pruned'] = True
+        elif empty[position].any() or full[position].any():
+          still_active.append(position)
+        # otherwise it's time to cross inequalities, which is the scalar solver's job
+
+      still_active = numpy.array(still_active, dtype=numpy.intp)
+      if not len(still_active):
+        break
+
+      # Stage: use trivial
+      newly_revealed = (empty[still_active].astype(numpy.int32) @ self.matrix).astype(bool) & ~known[still_active]
+      newly_flagged = (full[still_active].astype(numpy.int32) @ self.matrix).astype(bool) & ~known[still_active]
+
+      # and the same goes for any other hints that contradict each other, which can both reveal and flag a cell
+      agreed = ~(newly_revealed & newly_flagged).any(axis=1)
+      still_active = still_active[agreed]
+      newly_revealed = newly_revealed[agreed]
+      newly_flagged = newly_flagged[agreed]
+
+      for position, candidate in enumerate(active[still_active]):
+        summaries[candidate].append(dict(
+          num_ineqs=int(num_ineqs[still_active[position]]),
+          trivial=LazyCells(masks=dict(
+            revealed=to_mask(newly_revealed[position]),
+            flagged=to_mask(newly_flagged[position]),
+          )),
+        ))
+
+      active = active[still_active]
+      revealed[active] |= newly_revealed
+      flagged[active] |= newly_flagged
+
+    for candidate in range(count):
+      if results[candidate] is None:
+        results[candidate] = self.solve_scalar(layouts[candidate])
+
+    return results
+
+  def result(self, solved, revealed, flagged, summary):
+    return LazyCells(
+      dict(solved=solved, summary=summary),
+      dict(revealed=to_mask(revealed), flagged=to_mask(flagged)),
+    )
+
+  def solve_scalar(self, layout):
+    candidate = Candidate(self.template, layout.tobytes().decode('ascii'))
+    return candidate.puzzle(max_inexact_stages=self.max_inexact_stages, max_rounds=self.max_rounds).solve()
@@ -0,0 +1,149 @@
+import sys
+import glob
+import json
+import math
+import time
+import zipfile
+import argparse
+import statistics
+
+from loader import load
+from scorer import score
+from solver import add_profile
+
+
+def find_puzzles(folders=('puzzles', 'published')):
+  """
+  Yields (name, contents) for every .puz file in folders, including ones inside .zip files there. A zipped puzzle
+  that's byte-for-byte the same as one already found is skipped, since the published set ships both ways.
+  """
+  seen = set()
+
+  for folder in folders:
+    for filename in sorted(glob.glob(f'{folder}/*.puz') + glob.glob(f'{folder}/*.zip')):
+      if filename.endswith('.zip'):
+        with zipfile.ZipFile(filename) as archive:
+          found = [(f'{filename}:{member}', archive.read(member).decode('utf-8'))
+                   for member in sorted(archive.namelist()) if member.endswith('.puz')]
+      else:
+        with open(filename) as f:
+          found = [(filename, f.read())]
+
+      for name, contents in found:
+        if contents not in seen:
+          seen.add(contents)
+          yield name, contents
+
+
+def percentile(times, percent):
+  ordered = sorted(times)
+  return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+
+def summarize(times):
+  return dict(median=statistics.median(times), p95=percentile(times, 95))
+
+
+def bench(contents, repeat=5):
+  """
+  Loads and solves a puzzle repeat times and times each. A profiled warm-up run beforehand (not timed) counts the
+  inequalities created and the rounds it took.
+  """
+  puzzle, name, _ = load(contents)
+  puzzle.profile = True
+  result = puzzle.solve()
+  created = sum(stage['added'] for stage in add_profile(dict(), result['profile']).values())
+
+  load_times = []
+  solve_times = []
+  for _ in range(repeat):
+    st = time.perf_counter()
+    puzzle, _, _ = load(contents)
+    mt = time.perf_counter()
+    puzzle.solve()
+    et = time.perf_counter()
+
+    load_times.append(mt - st)
+    solve_times.append(et - mt)
+
+  return dict(
+    title=name,
+    load=summarize(load_times),
+    solve=summarize(solve_times),
+    ineqs_created=created,
+    rounds=len(result['summary']),
+    solved=result['solved'],
+    score=score(result, 'seqnum'),
+  )
+
+
+def run(repeat=5, match=None):
+  results = dict()
+
+  for name, contents in find_puzzles():
+    if match and match not in name:
+      continue
+
+    results[name] = bench(contents, repeat)
+    r = results[name]
+    print(f"{name[:70]:70} solve {r['solve']['median']:8.3f}s (p95 {r['solve']['p95']:8.3f}s), "
+          f"load {r['load']['median']:.3f}s, {r['ineqs_created']} ineqs, {r['rounds']} rounds")
+
+  return dict(
+    python=sys.version.split()[0],
+    repeat=repeat,
+    puzzles=results,
+  )
+
+
+def compare(baseline, current, threshold=0.1):
+  """
+  Returns lines describing each puzzle whose median solve time went up by more than threshold (a fraction) since
+  baseline, or whose solve changed (different rounds, inequalities or score)
+  """
+  regressions = []
+
+  for name, now in current['puzzles'].items():
+    before = baseline['puzzles'].get(name)
+    if before is None:
+      continue
+
+    old_time = before['solve']['median']
+    new_time = now['solve']['median']
+    if new_time > old_time * (1 + threshold):
+      regressions.append(f'{name}: solve median {old_time:.3f}s -> {new_time:.3f}s (+{(new_time / old_time - 1) * 100:.0f}%)')
+
+    for key in ['rounds', 'ineqs_created', 'solved', 'score']:
+      if before[key] != now[key]:
+        regressions.append(f'{name}: {key} changed from {before[key]} to {now[key]}')
+
+  return regressions
+
+
+# python benchmark.py [--repeat N] [--match TEXT] [--output FILE] [--compare BASELINE [--threshold PERCENT]]
+# loads and solves every puzzle in /puzzles and /published (zips included) N times each,
+# printing the median/p95 times and, with --output, saving them all as JSON
+# --compare checks this run against a saved one, listing regressions and exiting with 1 if there are any
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('--repeat', type=int, default=5, help='timed runs per puzzle')
+  parser.add_argument('--match', help='only benchmark puzzles whose name contains this')
+  parser.add_argument('--output', help='file to write the results to as JSON')
+  parser.add_argument('--compare', help='JSON from an earlier run to check for regressions against')
+  parser.add_argument('--threshold', type=float, default=10, help='percent slower that counts as a regression')
+  options = parser.parse_args()
+
+  results = run(options.repeat, options.match)
+
+  if options.output:
+    with open(options.output, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+
+  if options.compare:
+    with open(options.compare) as f:
+      regressions = compare(json.load(f), results, options.threshold / 100)
+
+    print()
+    print('\n'.join(regressions) if regressions else 'no regressions')
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,67 @@
+import os
+import pickle
+from collections import OrderedDict
+
+from atomic import atomic_write
+
+
+def entry_size(key, value):
+  """A rough count of the bytes a cached (score, result) pair takes up, good enough to budget memory with"""
+  scored, result = value
+  return 200 + len(key[-1]) + len(result['steps'])
+
+
+class ScoreCache(object):
+  """
+  A least-recently-used cache of (score, result) pairs keyed by (template, template args, score method, max rounds,
+  compressed).
+
+  Entries are evicted once their estimated size goes over max_bytes. If given a filename, the cache starts out with
+  whatever was saved there last and `save` writes it back.
+  """
+
+  def __init__(self, max_bytes=256 * 2 ** 20, filename=None):
+    self.entries = OrderedDict()
+    self.max_bytes = max_bytes
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.filename = filename
+
+    if filename and os.path.exists(filename):
+      with open(filename, 'rb') as f:
+        for key, value in pickle.load(f):
+          self.put(key, value)
+
+  def __len__(self):
+    return len(self.entries)
+
+  def get(self, key):
+    value = self.entries.get(key)
+
+    if value is None:
+      self.misses += 1
+      return None
+
+    self.hits += 1
+    self.entries.move_to_end(key)
+    return value
+
+  def put(self, key, value):
+    if key in self.entries:
+      self.size -= entry_size(key, self.entries.pop(key))
+
+    self.entries[key] = value
+    self.size += entry_size(key, value)
+
+    while self.size > self.max_bytes and self.entries:
+      old_key, old_value = self.entries.popitem(last=False)
+      self.size -= entry_size(old_key, old_value)
+
+  def save(self):
+    if not self.filename:
+      return
+
+    # written whole or not at all, so that a ^C halfway through doesn't lose the last good copy
+    entries = list(self.entries.items())
+    atomic_write(self.filename, lambda f: pickle.dump(entries, f, protocol=pickle.HIGHEST_PROTOCOL), 'wb')
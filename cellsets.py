@@ -0,0 +1,86 @@
+"""
+Sets of cells stored as bitmasks, where cell n is in the set if bit n (value 2 ** n) is set.
+
+Python ints are already fixed-width words under the hood (and hashable, which the solver relies on for keying
+inequalities), so they're the working representation. These are the primitives on top of them.
+"""
+
+from collections.abc import MutableMapping
+
+try:
+  popcount = int.bit_count  # Python 3.10+
+except AttributeError:
+  def popcount(num):
+    return bin(num).count('1')
+
+
+def from_cells(cells):
+  num = 0
+  for cell in cells:
+    num += 1 << cell
+  return num
+
+
+def bits(num):
+  """Yields each set bit of num as its value (a power of two), lowest first"""
+  while num:
+    low = num & -num
+    yield low
+    num ^= low
+
+
+def to_cells(num):
+  cells = set()
+
+  while num:
+    low = num & -num
+    cells.add(low.bit_length() - 1)
+    num ^= low
+
+  return cells
+
+
+class LazyCells(MutableMapping):
+  """
+  A dict that holds some of its values, sets of cells, as bitmasks instead, only turning each into a set (and keeping
+  that) the first time it's looked up. Solver results are made of these, since most are thrown away unread.
+  """
+
+  def __init__(self, values=(), masks=()):
+    self.values = dict(values)
+    self.masks = dict(masks)
+
+  def __getitem__(self, key):
+    if key in self.masks:
+      self.values[key] = to_cells(self.masks.pop(key))
+
+    return self.values[key]
+
+  def __setitem__(self, key, value):
+    self.masks.pop(key, None)
+    self.values[key] = value
+
+  def __delitem__(self, key):
+    if key in self.masks:
+      del self.masks[key]
+    else:
+      del self.values[key]
+
+  def __iter__(self):
+    return iter(list(self.values) + list(self.masks))
+
+  def __len__(self):
+    return len(self.values) + len(self.masks)
+
+  def __contains__(self, key):
+    return key in self.values or key in self.masks
+
+  def __repr__(self):
+    return repr(dict(self))
+
+  def mask(self, key):
+    """The bitmask for a set of cells, whether or not it's been looked up"""
+    if key in self.masks:
+      return self.masks[key]
+
+    return from_cells(self.values[key])
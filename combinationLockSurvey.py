@@ -1,32 +1,14 @@
 import sys
-from TametsiGenerator import get_difficulty_steps, smooth_difficulty
 
+from survey import survey, hardest
 
-def CL_survey(num):
-  first_half = ['']
-  second_half = None
-  squared = num ** 2
-
-  for i in range((squared + 1) // 2):
-    temp = []
-    for s in first_half:
-      temp.extend([s + '.', s + '*', s + '?'])
-    first_half = temp
-
-    if i == squared // 2 - 1:
-      second_half = temp
 
-  print(first_half)
-  print(second_half)
-
-  with open('survey_{num}x{num}.txt'.format(num=num), 'w') as file:
-    for s1 in first_half:
-      for s2 in second_half:
-        s = s1 + s2
+def CL_survey(num):
+  """Surveys combination_lock num (see survey.py), writing the results to survey_combination_lock_<num>/"""
+  folder = survey('combination_lock', (num,))
 
-        output = ','.join(map(str, [s, smooth_difficulty(num, num, s), get_difficulty_steps(num, num, s, cache_only=True)]))
-        print(output)
-        file.write(output + '\n')
+  for compressed, scored, steps, weight in hardest(folder):
+    print(compressed, scored, steps, weight)
 
 
 if __name__ == '__main__':
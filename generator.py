@@ -1,25 +1,48 @@
 import re
 import sys
+import time
+import pickle
+import signal
 import random
+import argparse
 import operator
+from concurrent.futures import ProcessPoolExecutor
+
+from atomic import atomic_write
+from cache import ScoreCache
+from cellsets import LazyCells, from_cells, to_cells
+from results import ResultLog
+from solver import add_profile, format_profile
+from scorer import accumulator
+from templater import make_template, transform, Candidate
+
+try:
+  from batch import BatchSolver, layouts_to_array, layouts_to_strings, sample_layouts, one_char_variants, weighted_probabilities
+except ImportError:  # no NumPy
+  BatchSolver = None
+
+
+def score_candidate(candidate, score_method, verbose=False, previous=None, changed=None, checkpoint=False, profile=False,
+                    max_rounds=None):
+  # candidate: a templater.Candidate; previous/changed: a checkpointed result for a layout differing only at index changed
+  # max_rounds: give up on (prune) solves that run longer, scoring them -1
+  scorer = accumulator(score_method)
+  puzzle = candidate.puzzle(verbose=verbose, max_inexact_stages=1, profile=profile, max_rounds=max_rounds, scorer=scorer)
+
+  if previous is not None:
+    result = puzzle.resolve(previous, candidate.template.board[changed][0])
+  else:
+    result = puzzle.solve(checkpoint=checkpoint)
 
-from solver import Puzzle
-from scorer import score
-from templater import make_template, replace_cells
-
-
-def score_candidate(board, revealed, constraints, compressed, score_method, verbose=False):
-  replace_cells(board, revealed, constraints, compressed)
-  puzzle = Puzzle(board, revealed, constraints, verbose=verbose, max_inexact_stages=1)
-  result = puzzle.solve()
-  return score(result, score_method), result
+  result['steps'] = scorer.steps
+  return scorer.score(result['solved']), result
 
 
-def random_compressed(num, probabilities):
+def random_compressed(num, probabilities, rng=random):
   c = ''
 
   for index in range(num):
-    r = random.random()
+    r = rng.random()
     if r <= probabilities[index][0]:
       c += '.'
     elif r <= probabilities[index][0] + probabilities[index][1]:
@@ -30,14 +53,368 @@ def random_compressed(num, probabilities):
   return c
 
 
-def iteration(template_method, score_method, *template_args, **template_kwargs):
-  probabilities = [0.2, 0.5]  # First is for '.', second is for '*', and remainder is '?'
+def prepare_template(template_method, template_args, template_kwargs, profile=False, max_rounds=None):
   data = make_template(template_method, *template_args, **template_kwargs)
-  num = data['num']
+  data['id_map'] = {data['board'][index][0]: index for index in range(data['num'])}
+  data['profile'] = profile
+  data['max_rounds'] = max_rounds
+  return data
+
+
+def repair_candidate(data, candidate, result, probabilities, rng):
+  """Re-rolls the cells of a failed candidate around where the solver got stuck"""
   board = data['board']
-  revealed = data['revealed']
-  constraints = data['constraints']
+  id_map = data['id_map']
+
+  result_known = result['revealed'].union(result['flagged'])
+  boundary_empty = set()
+  boundary_question = set()
+  boundary_unknown = set()
+  all_unknown = set()
+
+  for cell_id, _, neighbors in board:
+    index = id_map.get(cell_id, len(candidate))
+    what = candidate[index] if index < len(candidate) else '.'
+
+    if cell_id in result['revealed'] and set(neighbors).difference(result_known):
+      if what == '.':
+        boundary_empty.add(cell_id)
+      elif what == '?':
+        boundary_question.add(cell_id)
+      else:
+        raise ValueError('We got a problem here!')
+
+    elif cell_id not in result_known:
+      all_unknown.add(cell_id)
+
+      if set(neighbors).intersection(result_known):
+        boundary_unknown.add(cell_id)
+
+  exploded = list(candidate)
+
+  if boundary_question:
+    for cell_id in boundary_question:
+      exploded[id_map[cell_id]] = '.'
+
+  elif boundary_unknown:
+    replacements = list(random_compressed(len(boundary_unknown), probabilities, rng))
+    for cell_id in boundary_unknown:
+      exploded[id_map[cell_id]] = replacements.pop()
+
+  else:
+    replacements = list(random_compressed(len(all_unknown), probabilities, rng))
+    for cell_id in all_unknown:
+      exploded[id_map[cell_id]] = replacements.pop()
+
+  return ''.join(exploded)
+
+
+def strip_result(result):
+  """
+  Keeps just the parts of a solver result that are worth sending between processes and caching. The summary's only
+  needed for its steps, which the scorer has already worked out, and revealed/flagged stay bitmasks.
+  """
+  stripped = LazyCells(
+    dict(solved=result['solved'], steps=result['steps']),
+    dict(revealed=result.mask('revealed'), flagged=result.mask('flagged')),
+  )
+
+  if 'profile' in result:
+    stripped['profile'] = result['profile']
+
+  if result.get('pruned'):
+    stripped['pruned'] = True
+
+  return stripped
+
+
+def score_base(data, score_method, base):
+  """
+  Scores base with checkpoints for its variants to re-solve from, reusing the last one if it's the same. Returns the
+  score, the result and base's Candidate, which its variants are made from.
+  """
+  if data.get('base', [None])[0] != base:
+    candidate = Candidate(data['template'], base)
+    scored = score_candidate(candidate, score_method, checkpoint=True, profile=data['profile'], max_rounds=data['max_rounds'])
+    data['base'] = [base, *scored, candidate]
+
+  return data['base'][1:]
+
+
+def score_changes(data, score_method, changes, base=None):
+  """
+  Scores each (index, candidate) in changes. Given a base, each candidate is a 1-char variant of it changed at index,
+  which is applied to the base's Candidate as a single change and re-solved incrementally from the base's
+  checkpoints, or base itself with index None; otherwise index is unused.
+  """
+  template = data['template']
+  profile = data['profile']
+  max_rounds = data['max_rounds']
+  base_result = None
+  if base is not None:
+    base_score, base_result, base_candidate = score_base(data, score_method, base)
+
+  # the batch solver doesn't keep per-stage counts, so profiling runs everything through the scalar solver
+  if base_result is None and BatchSolver is not None and len(changes) > 1 and not profile:
+    if 'batch' not in data:
+      data['batch'] = BatchSolver(template, max_inexact_stages=1, max_rounds=max_rounds)
+
+    scores = []
+    for result in data['batch'].solve(layouts_to_array([candidate for _, candidate in changes])):
+      scorer = accumulator(score_method).feed(result['summary'])
+      result['steps'] = scorer.steps
+      scores.append((scorer.score(result['solved']), strip_result(result)))
+
+    return scores
+
+  scores = []
+  for index, candidate in changes:
+    if base_result is not None and index is None:
+      scored, result = base_score, base_result
+    elif base_result is not None:
+      variant = base_candidate.change(index, candidate[index])
+      scored, result = score_candidate(variant, score_method, previous=base_result, changed=index, profile=profile,
+                                       max_rounds=max_rounds)
+    else:
+      scored, result = score_candidate(Candidate(template, candidate), score_method, profile=profile,
+                                       max_rounds=max_rounds)
+
+    scores.append((scored, strip_result(result)))
+
+  return scores
+
+
+def orient_result(template, result, source, target):
+  """
+  source's result carried over to target, one of its symmetric images (see Template.symmetries): the steps and score
+  are the same, but the revealed and flagged cells move with the board
+  """
+  if source == target:
+    return result
+
+  cells = next(cells for perm, cells in template.symmetries() if transform(source, perm) == target)
+  masks = {key: from_cells(cells[cell] for cell in to_cells(result.mask(key))) for key in ['revealed', 'flagged']}
+  return LazyCells({key: result[key] for key in result if key not in masks}, masks)
+
+
+# each worker process builds its own copy of the template once and keeps it here
+worker_data = None
+
+
+def init_worker(template_method, template_args, template_kwargs, profile, max_rounds):
+  global worker_data
+  signal.signal(signal.SIGINT, signal.SIG_IGN)  # ^C is the parent's to handle
+  signal.signal(signal.SIGTERM, signal.SIG_DFL)  # and so is turning SIGTERM into one
+  worker_data = prepare_template(template_method, template_args, template_kwargs, profile, max_rounds)
+
+
+def worker_score(score_method, changes, base):
+  return score_changes(worker_data, score_method, changes, base)
+
+
+class Evaluator(object):
+  """
+  Scores batches of candidates for one template, either in this process or spread over a pool of worker processes.
+
+  Anything already in the cache isn't scored again. Results only depend on the inputs (trials get their own seeds),
+  so they're the same for any number of workers. With profile, the solver's per-stage counts for everything scored
+  are added up in `profile` and printed on close.
+
+  With max_rounds, solves taking more rounds than that are cut short and scored -1.
+
+  With canonical, candidates that are rotations or reflections of each other (see Template.canonical) share one solve
+  and one cache entry. Only scored with the solver, the images of a candidate can come out a little differently, since
+  the order it crosses inequalities in follows the cell ids; canonical trades that for fewer solves.
+  """
+
+  def __init__(self, template_method, score_method, template_args, template_kwargs, workers=1, cache=None, profile=False,
+               max_rounds=None, canonical=False):
+    self.score_method = score_method
+    self.data = prepare_template(template_method, template_args, template_kwargs, profile, max_rounds)
+    self.template = self.data['template']
+    self.canonical = canonical
+    self.profile = dict() if profile else None
+    # results depend on max_rounds too: with a budget, a solve that runs over it scores -1
+    self.key = (template_method, tuple(template_args), tuple(sorted(template_kwargs.items())), score_method, max_rounds)
+    if canonical:  # its entries are shared between images, so keep them apart from the others
+      self.key += ('canonical',)
+    self.cache = cache
+    self.workers = workers
+    self.pool = None
+
+    if workers > 1:
+      self.pool = ProcessPoolExecutor(
+        workers,
+        initializer=init_worker,
+        initargs=(template_method, template_args, template_kwargs, profile, max_rounds),
+      )
+
+  def close(self):
+    if self.pool:
+      self.pool.shutdown(cancel_futures=True)
+
+    if self.cache is not None:
+      self.cache.save()
+
+    if self.profile:
+      print('\nsolver profile:')
+      print(format_profile(self.profile))
+
+  def run(self, changes, base=None):
+    if not self.pool:
+      return score_changes(self.data, self.score_method, changes, base)
+
+    size = max(1, len(changes) // (4 * self.workers))
+    chunks = [changes[start:start + size] for start in range(0, len(changes), size)]
+
+    scores = []
+    count = len(chunks)
+    for chunk_scores in self.pool.map(worker_score, [self.score_method] * count, chunks, [base] * count):
+      scores.extend(chunk_scores)
+
+    return scores
+
+  def score(self, changes, base=None):
+    """Scores each (index, candidate) in changes as score_changes does, returning (score, result) pairs"""
+    scores = [None] * len(changes)
+    misses = dict()
+
+    for position, (index, candidate) in enumerate(changes):
+      form = self.form(candidate)
+      found = self.cache.get(self.key + (form,)) if self.cache is not None else None
+
+      if found is not None:
+        scores[position] = self.orient(found, form, candidate)
+      else:
+        misses.setdefault(form, [index, candidate, []])[2].append(position)
+
+    todo = [(index, candidate) for index, candidate, _ in misses.values()]
+    for (form, (_, candidate, positions)), scored in zip(misses.items(), self.run(todo, base)):
+      if self.profile is not None:
+        add_profile(self.profile, scored[1].pop('profile', []))
+
+      if self.cache is not None:
+        self.cache.put(self.key + (form,), self.orient(scored, candidate, form))
+
+      for position in positions:
+        scores[position] = self.orient(scored, candidate, changes[position][1])
+
+    return scores
+
+  def form(self, candidate):
+    """What candidate is cached and logged as: its canonical form with canonical, otherwise itself"""
+    return self.template.canonical(candidate) if self.canonical else candidate
+
+  def log_fields(self, candidate):
+    """Extra fields for a result log record of candidate, so that results.top can tell images apart from new finds"""
+    return dict(canonical=self.form(candidate)) if self.canonical else dict()
+
+  def orient(self, scored, source, target):
+    if source == target:
+      return scored
+
+    return scored[0], orient_result(self.template, scored[1], source, target)
+
+  def base(self, base):
+    # solved with the checkpoints its variants are then re-solved from, so it's only solved once
+    return self.score([(None, base)], base)[0]
+
+  def variants(self, base, changes):
+    return self.score(changes, base)
+
+  def trials(self, probabilities, seeds, comp=operator.gt, limit=0):
+    """
+    Scores a random candidate per seed, repairing each failed one around where the solver got stuck up to 10 times.
+    Trials are scored in waves so that every wave is one batch.
+    """
+    rngs = [random.Random(seed) for seed in seeds]
+    if BatchSolver is not None:
+      candidates = layouts_to_strings(sample_layouts(probabilities, rngs))
+    else:
+      candidates = [random_compressed(len(probabilities), probabilities, rng) for rng in rngs]
+    results = [None] * len(seeds)
+    attempts = [10] * len(seeds)
+    active = list(range(len(seeds)))
+
+    while active:
+      scores = self.score([(None, candidates[trial]) for trial in active])
+      still_active = []
+
+      for trial, (scored, result) in zip(active, scores):
+        attempts[trial] -= 1
+        results[trial] = (scored, result)
+
+        if comp(scored, limit):
+          continue
+
+        candidates[trial] = repair_candidate(self.data, candidates[trial], result, probabilities, rngs[trial])
+        if attempts[trial]:
+          still_active.append(trial)
+
+      active = still_active
+
+    return [(scored, candidate, result) for (scored, result), candidate in zip(results, candidates)]
+
+  def stats(self):
+    if self.cache is None:
+      return ''
+
+    return f' [cache {self.cache.hits} hits / {self.cache.misses} misses]'
+
+
+class Checkpointer(object):
+  """
+  Saves a generator run's state (whatever lets it pick up where it left off) to filename after every round, and the
+  score cache, which can be big, every interval seconds. Both are written then renamed, so a run killed halfway
+  through a save still has the last one. Does nothing without a filename.
+  """
+
+  def __init__(self, filename, run, cache=None, interval=600):
+    self.filename = filename
+    self.run = run  # which generator, template and scoring method, so one run's state can't be resumed as another's
+    self.cache = cache
+    self.interval = interval
+    self.cache_saved = time.monotonic()
+
+  def load(self):
+    with open(self.filename, 'rb') as f:
+      saved = pickle.load(f)
+
+    if saved['run'] != self.run:
+      raise ValueError(f'{self.filename} is a checkpoint of a different run: {saved["run"]}')
+
+    return saved['state']
+
+  def seed(self):
+    """The seed the saved run was started with, without checking it's this run's"""
+    with open(self.filename, 'rb') as f:
+      return pickle.load(f)['state'].get('seed')
+
+  def save(self, state):
+    if not self.filename:
+      return
+
+    saved = dict(run=self.run, state=state)
+    atomic_write(self.filename, lambda f: pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL), 'wb')
+
+    if self.cache is not None and time.monotonic() - self.cache_saved >= self.interval:
+      self.cache.save()
+      self.cache_saved = time.monotonic()
+
+
+def iteration(template_method, score_method, *template_args, workers=1, cache=None, profile=False, max_rounds=None,
+              seed=None, checkpoint_file=None, resume=False, result_log=None, canonical=False, **template_kwargs):
+  # seed: for this run's random numbers; checkpoint_file/resume: see Checkpointer
+  # result_log: a results.ResultLog to record each round's best in; canonical: see Evaluator
+  probabilities = [0.2, 0.5]  # First is for '.', second is for '*', and remainder is '?'
+  evaluator = Evaluator(template_method, score_method, template_args, template_kwargs, workers, cache, profile, max_rounds,
+                        canonical)
+  checkpointer = Checkpointer(checkpoint_file, ('iteration',) + evaluator.key, cache)
+  rng = random.Random(seed)
+  data = evaluator.data
+  num = data['num']
   sanity_check = data.get('sanity_check', None)
+  sanity_checks = data.get('sanity_checks', None)  # the same, for a whole array of layouts at once
 
   invert_sort = False  # True if lower scores are better
   if invert_sort:
@@ -50,73 +427,115 @@ def iteration(template_method, score_method, *template_args, **template_kwargs):
   threshold = limit
   round_num = 0
   scores = []
+  best_round = None  # (score, candidate) of the best round so far
+
+  if resume:
+    state = checkpointer.load()
+    probabilities = state['probabilities']
+    threshold = state['threshold']
+    round_num = state['round_num']
+    scores = state['scores']
+    best_round = state['best_round']
+    rng.setstate(state['rng'])
+    seed = state.get('seed', seed)
+    print(f'resuming after round {round_num}', end='')
+    print(f', best so far: {best_round[1]} with score {best_round[0]}' if best_round else '')
 
-  while 1:
-    prob_list = [probabilities] * num
-    base = random_compressed(num, prob_list)
-
-    while not sanity_check(base):
-      base = random_compressed(num, prob_list)
-
-    round_num += 1
-    temp_threshold = score_candidate(board, revealed, constraints, base, score_method)[0]
-    temp_best = base
-    temp_result = None
-
-    iteration = 0
+  try:
     while 1:
-      iteration += 1
+      checkpointer.save(dict(
+        probabilities=probabilities, threshold=threshold, round_num=round_num, scores=scores, best_round=best_round,
+        rng=rng.getstate(), seed=seed,
+      ))
 
-      variants = {}
+      prob_list = [probabilities] * num
+      base = random_compressed(num, prob_list, rng)
 
-      for i in range(len(base)):
-        for c in '.*?':
-          if base[i] == c:
-            continue
+      while not sanity_check(base):
+        base = random_compressed(num, prob_list, rng)
 
-          v = base[:i] + c + base[i + 1:]
+      round_num += 1
+      temp_threshold, temp_result = evaluator.base(base)
+      temp_best = base
 
-          if v not in variants and sanity_check(v):
-            variants[v] = score_candidate(board, revealed, constraints, v, score_method)
+      iteration = 0
+      while 1:
+        iteration += 1
 
-      best = sorted(variants.items(), key=lambda x: x[1][0], reverse=invert_sort)[-1]
+        if sanity_checks is not None:
+          indexes, layouts = one_char_variants(base, '.*?')
+          passed = sanity_checks(layouts)
+          changes = [(int(i), v) for i, v, ok in zip(indexes, layouts_to_strings(layouts), passed) if ok]
 
-      if comp(best[1][0], temp_threshold):
-        temp_best = best[0]
-        temp_threshold = best[1][0]
-        temp_result = best[1][1]
+        else:
+          changes = []
+          seen = set()
 
-      else:
-        break
+          for i in range(len(base)):
+            for c in '.*?':
+              if base[i] == c:
+                continue
 
-    scores.append(temp_threshold)
+              v = base[:i] + c + base[i + 1:]
 
-    if len(scores) == 1 or comp(temp_threshold, 0.8 * threshold):
-      probabilities[0] = (probabilities[0] + temp_best.count('.') / len(temp_best)) / 2
-      probabilities[1] = (probabilities[1] + temp_best.count('*') / len(temp_best)) / 2
+              if v not in seen and sanity_check(v):
+                seen.add(v)
+                changes.append((i, v))
 
-      output = 'Best of round {}: {} with score {}'.format(round_num, temp_best, temp_threshold)
-      if comp(temp_threshold, limit):
-        steps = ''.join(['T' if 'trivial' in step else 'E' if 'exact' in step else 'I' for step in temp_result['summary']])
-        output += f' and steps {steps}'
-      print(output)
+        # variants that can't beat the current best don't need their exact scores (see Evaluator)
+        variants = {v: scored for (i, v), scored in zip(changes, evaluator.variants(base, changes))}
+        best = sorted(variants.items(), key=lambda x: x[1][0], reverse=invert_sort)[-1]
 
-    if comp(temp_threshold, threshold):
-      probabilities[0] = temp_best.count('.') / len(temp_best)
-      probabilities[1] = temp_best.count('*') / len(temp_best)
-      threshold = temp_threshold
-      print(' ^ Best so far!')
+        if comp(best[1][0], temp_threshold):
+          temp_best = best[0]
+          temp_threshold = best[1][0]
+          temp_result = best[1][1]
 
+        else:
+          break
 
-def gradient_ascent(template_method, score_method, *template_args, **template_kwargs):
-  data = make_template(template_method, *template_args, **template_kwargs)
+      scores.append(temp_threshold)
+
+      if result_log is not None:
+        result_log.write(round_num, temp_best, temp_threshold, temp_result['steps'], **evaluator.log_fields(temp_best))
+
+      if len(scores) == 1 or comp(temp_threshold, 0.8 * threshold):
+        probabilities[0] = (probabilities[0] + temp_best.count('.') / len(temp_best)) / 2
+        probabilities[1] = (probabilities[1] + temp_best.count('*') / len(temp_best)) / 2
+
+        output = 'Best of round {}: {} with score {}'.format(round_num, temp_best, temp_threshold)
+        if comp(temp_threshold, limit):
+          output += f" and steps {temp_result['steps']}"
+        print(output + evaluator.stats())
+
+      if comp(temp_threshold, threshold):
+        probabilities[0] = temp_best.count('.') / len(temp_best)
+        probabilities[1] = temp_best.count('*') / len(temp_best)
+        threshold = temp_threshold
+        best_round = (temp_threshold, temp_best)
+        print(' ^ Best so far!')
+
+  finally:
+    evaluator.close()
+
+    if result_log is not None:
+      result_log.close()
+
+
+def gradient_ascent(template_method, score_method, *template_args, workers=1, cache=None, profile=False, max_rounds=None,
+                    seed=None, checkpoint_file=None, resume=False, island=None, result_log=None, canonical=False,
+                    **template_kwargs):
+  # seed: for this run's random numbers; checkpoint_file/resume: see Checkpointer
+  # result_log: a results.ResultLog to record each round's best in; canonical: see Evaluator
+  # island: an islands.Island when this is one of several populations run side by side, which trade candidates
+  evaluator = Evaluator(template_method, score_method, template_args, template_kwargs, workers, cache, profile, max_rounds,
+                        canonical)
+  checkpointer = Checkpointer(checkpoint_file, ('gradient_ascent',) + evaluator.key, cache)
+  rng = random.Random(seed)
+  data = evaluator.data
   num = data['num']
-  board = data['board']
   revealed = data['revealed']
-  constraints = data['constraints']
-  sanity_check = data.get('sanity_check', None)
 
-  id_map = {board[index][0]: index for index in range(num)}
   starting_probabilities = [0.5, 0.25]  # First is for '.', second is for '*', and remainder is '?'
 
   trials = 50
@@ -134,117 +553,109 @@ def gradient_ascent(template_method, score_method, *template_args, **template_kw
   best_score = 0
   num_unrevealed = num - len(revealed)
   probabilities = [starting_probabilities[:] for _ in range(num_unrevealed)]
+  best_round = None  # (score, candidate) of the best round so far
+  say = print if island is None else island.say
+
+  if resume:
+    state = checkpointer.load()
+    probabilities = state['probabilities']
+    best_score = state['best_score']
+    round_num = state['round_num']
+    best_round = state['best_round']
+    rng.setstate(state['rng'])
+    seed = state.get('seed', seed)
+    say(f'resuming after round {round_num}', end='')
+    say(f', best so far: {best_round[1]} with score {best_round[0]}' if best_round else '')
 
-  while 1:
-    solved = []
-    round_num += 1
-
-    while len(solved) < trials:
-      attempts = 10
-      candidate = random_compressed(num_unrevealed, probabilities)
-
-      while attempts:
-        attempts -= 1
-
-        scored, result = score_candidate(board, revealed, constraints, candidate, score_method)
-        # print(f'score {scored} in {len(result["summary"])} rounds for candidate {candidate}')
-
-        if comp(scored, limit):
-          break
-
-        result_known = result['revealed'].union(result['flagged'])
-        boundary_empty = set()
-        boundary_question = set()
-        boundary_unknown = set()
-        all_unknown = set()
-
-        for cell_id, what, neighbors in board:
-          if cell_id in result['revealed'] and set(neighbors).difference(result_known):
-            if what == '.':
-              boundary_empty.add(cell_id)
-            elif what == '?':
-              boundary_question.add(cell_id)
-            else:
-              raise ValueError('We got a problem here!')
+  try:
+    while 1:
+      checkpointer.save(dict(
+        probabilities=probabilities, best_score=best_score, round_num=round_num, best_round=best_round, rng=rng.getstate(),
+        seed=seed,
+      ))
 
-          elif cell_id not in result_known:
-            all_unknown.add(cell_id)
+      round_num += 1
 
-            if set(neighbors).intersection(result_known):
-              boundary_unknown.add(cell_id)
+      seeds = [rng.getrandbits(64) for _ in range(trials)]
+      solved = [list(trial) for trial in evaluator.trials(probabilities, seeds, comp, limit)]
+      if island is not None:
+        solved += island.arrivals(solved)
 
-        exploded = list(candidate)
+      top = sorted(solved, key=lambda x: x[0], reverse=invert_sort)[-best_of:]
+      round_best = top[-1]
 
-        if boundary_question:
-          for cell_id in boundary_question:
-            exploded[id_map[cell_id]] = '.'
+      if comp(top[-1][0], 0.8 * best_score):
+        # iteration stage - 1-char changes
+        base_variant = top[-1]
 
-        elif boundary_unknown:
-          replacements = list(random_compressed(len(boundary_unknown), probabilities))
-          for cell_id in boundary_unknown:
-            exploded[id_map[cell_id]] = replacements.pop()
+        while 1:
+          base_candidate = base_variant[1]
+          changes = []
 
-        else:
-          replacements = list(random_compressed(len(all_unknown), probabilities))
-          for cell_id in all_unknown:
-            exploded[id_map[cell_id]] = replacements.pop()
+          for index in range(num_unrevealed):
+            for char in ['.', '?', '*']:
+              if char == base_candidate[index]:
+                continue
 
-        candidate = ''.join(exploded)
+              changes.append((index, base_candidate[:index] + char + base_candidate[index + 1:]))
 
-        if sanity_check and not sanity_check(candidate):
-          continue
+          scored_changes = evaluator.variants(base_candidate, changes)
+          variants = [[scored, candidate, result] for (index, candidate), (scored, result) in zip(changes, scored_changes)]
 
-        # import ipdb; ipdb.set_trace()
+          best_variant = sorted(variants, key=lambda x: x[0], reverse=invert_sort)[-1]
+          if not comp(best_variant[0], base_variant[0]):
+            break
+          base_variant = best_variant
 
-      solved.append([scored, candidate, result])
+        output = f'Best of round {round_num}: {base_variant[1]} with score {base_variant[0]}'
+        if comp(base_variant[0], limit):
+          output = output + ' and steps ' + base_variant[2]['steps']
+        say(output + evaluator.stats())
 
-    top = sorted(solved, key=lambda x: x[0], reverse=invert_sort)[-best_of:]
+        if island is not None:
+          island.report(round_num, base_variant)
 
-    if comp(top[-1][0], 0.8 * best_score):
-      # iteration stage - 1-char changes
-      base_variant = top[-1]
+        round_best = base_variant
+        if best_round is None or comp(base_variant[0], best_round[0]):
+          best_round = (base_variant[0], base_variant[1])
 
-      while 1:
-        variants = []
-        base_candidate = base_variant[1]
+        if BatchSolver is not None:
+          layouts = layouts_to_array([c for s, c, r in top])
+          probabilities = weighted_probabilities(layouts, [s for s, c, r in top]).tolist()
 
-        for index in range(num_unrevealed):
-          for char in ['.', '?', '*']:
-            if char == base_candidate[index]:
-              continue
+        else:
+          score_total = sum([_[0] for _ in top])
+          for index in range(num_unrevealed):
+            probabilities[index][0] = sum([s * (c[index] == '.') for s, c, r in top]) / score_total
+            probabilities[index][1] = sum([s * (c[index] == '*') for s, c, r in top]) / score_total
 
-            candidate = base_candidate[:index] + char + base_candidate[index + 1:]
-            scored, result = score_candidate(board, revealed, constraints, candidate, score_method)
-            variants.append([scored, candidate, result])
+        # print('new probabilities:', '; '.join('{:.3f},{:.3f}'.format(*p) for p in probabilities))
 
-        best_variant = sorted(variants, key=lambda x: x[0], reverse=invert_sort)[-1]
-        if not comp(best_variant[0], base_variant[0]):
-          break
-        base_variant = best_variant
+      if comp(top[-1][0], best_score):
+        best_score = top[-1][0]
+        say(' ^ Best so far!')
 
-      output = f'Best of round {round_num}: {base_variant[1]} with score {base_variant[0]}'
-      if comp(base_variant[0], limit):
-        output = output + ' and steps ' + ''.join(['T' if 'trivial' in step else 'E' if 'exact' in step else 'I' for step in base_variant[2]['summary']])
-      print(output)
+      if result_log is not None:
+        result_log.write(round_num, round_best[1], round_best[0], round_best[2]['steps'],
+                         **evaluator.log_fields(round_best[1]))
 
-      score_total = sum([_[0] for _ in top])
-      for index in range(num_unrevealed):
-        probabilities[index][0] = sum([s * (c[index] == '.') for s, c, r in top]) / score_total
-        probabilities[index][1] = sum([s * (c[index] == '*') for s, c, r in top]) / score_total
+      if island is not None:
+        probabilities = island.exchange(round_num, top, probabilities)
 
-      # print('new probabilities:', '; '.join('{:.3f},{:.3f}'.format(*p) for p in probabilities))
+      if sum([p in [[0, 0], [0, 1], [1, 0]] for p in probabilities]) > 0.8 * len(probabilities):
+        say('\n<restarting>\n')
+        best_score = 0
+        probabilities = [starting_probabilities[:] for _ in range(num_unrevealed)]
 
-    if comp(top[-1][0], best_score):
-      best_score = top[-1][0]
-      print(' ^ Best so far!')
+  finally:
+    evaluator.close()
 
-    if sum([p in [[0, 0], [0, 1], [1, 0]] for p in probabilities]) > 0.8 * len(probabilities):
-      print('\n<restarting>\n')
-      best_score = 0
-      probabilities = [starting_probabilities[:] for _ in range(num_unrevealed)]
+    if result_log is not None:
+      result_log.close()
 
 
-# python generator <template_name> <scoring_method> [arg1] [arg2] [...]
+# python generator <template_name> <scoring_method> [arg1] [arg2] [...] [--workers N] [--cache-size MB] [--cache-file FILE] [--profile]
+#   [--max-rounds N] [--seed N] [--checkpoint FILE [--resume]] [--log FILE] [--canonical]
 
 # there are two generation algorithms, 'iteration' and 'gradient_ascent';
 # gradient_ascent is the default since it tends to produce better results faster
@@ -260,9 +671,50 @@ if __name__ == '__main__':
   # gradient_ascent('cl_corner_bite', 'seqnum', size)
   # gradient_ascent('holey', 'seqnum', size)
   # gradient_ascent('l_shape_grid', 'seqnum', *sys.argv[1:])
-  args = [int(arg) if re.match(r'\d+', arg) else arg for arg in sys.argv[1:]]
+  parser = argparse.ArgumentParser()
+  parser.add_argument('template_method')
+  parser.add_argument('score_method')
+  parser.add_argument('template_args', nargs='*')
+  parser.add_argument('--workers', type=int, default=1, help='number of processes to score candidates with')
+  parser.add_argument('--cache-size', type=float, default=256, help='megabytes of scored candidates to remember')
+  parser.add_argument('--cache-file', help='file to load scored candidates from and save them back to')
+  parser.add_argument('--profile', action='store_true', help='time each solver stage and print a report at the end')
+  parser.add_argument('--max-rounds', type=int, help='give up on solves taking more rounds, scoring them -1')
+  parser.add_argument('--seed', type=int, help='seed for the run, so that it can be repeated exactly')
+  parser.add_argument('--checkpoint', help='file to save the run\'s progress to after every round')
+  parser.add_argument('--resume', action='store_true', help='carry on from the state saved in --checkpoint')
+  parser.add_argument('--log', help='file to append each round\'s best to as JSON lines (see results.py)')
+  parser.add_argument('--canonical', action='store_true', help='score rotations and reflections of a candidate once')
+  options = parser.parse_args()
+
+  if options.resume and not options.checkpoint:
+    parser.error('--resume needs --checkpoint')
+
+  # a run is only repeatable if its seed is known, so pick one if none was given; a resumed run keeps the saved one
+  if options.resume:
+    saved_seed = Checkpointer(options.checkpoint, None).seed()
+    if options.seed is not None and options.seed != saved_seed:
+      parser.error(f'--seed {options.seed} doesn\'t match the seed {saved_seed} that {options.checkpoint} was started with')
+    options.seed = saved_seed
+  elif options.seed is None:
+    options.seed = random.randrange(2 ** 32)
+  print('seed:', options.seed)
+
+  # pre-emption usually comes as SIGTERM; treating it like ^C lets the cache be saved on the way out
+  signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+  args = [int(arg) if re.match(r'\d+', arg) else arg for arg in options.template_args]
 
   try:
-    gradient_ascent(*args)
+    cache = ScoreCache(int(options.cache_size * 2 ** 20), options.cache_file)
+    result_log = None
+    if options.log:
+      fields = dict(template=options.template_method, args=args, score_method=options.score_method, seed=options.seed)
+      result_log = ResultLog(options.log, fields)
+
+    gradient_ascent(options.template_method, options.score_method, *args, workers=options.workers, cache=cache,
+                    profile=options.profile, max_rounds=options.max_rounds, seed=options.seed,
+                    checkpoint_file=options.checkpoint, resume=options.resume, result_log=result_log,
+                    canonical=options.canonical)
   except KeyboardInterrupt:
     print('^C interrupted!')
@@ -0,0 +1,183 @@
+"""
+Runs several gradient_ascent populations ("islands") side by side, one per process.
+
+Each island has its own seed, so they search different parts of the space. Every few rounds each one sends its best
+few candidates and its per-cell probabilities on to the next island in a ring, and it blends whatever arrives from
+the one before into its own. Good layouts spread without every island converging on the same thing, and a converged
+island gets pulled back out instead of throwing its population away on a restart.
+
+The parent process is the coordinator: islands report their best of each round to it, and it prints each layout the
+first time any island finds it, keeping track of the best of them all.
+"""
+
+import re
+import sys
+import queue
+import signal
+import argparse
+import multiprocessing
+
+from cache import ScoreCache
+from results import ResultLog
+from generator import gradient_ascent
+from templater import get_template
+
+
+class Island(object):
+  """
+  What an island's gradient_ascent uses to trade with its neighbours. Candidates travel as [score, candidate, result]
+  like the rest of the round's, and probabilities as gradient_ascent keeps them.
+  """
+
+  def __init__(self, index, inbox, outbox, reports, interval=5, migrants=3, blend=0.25):
+    self.index = index
+    self.inbox = inbox  # from the previous island in the ring
+    self.outbox = outbox  # to the next
+    self.reports = reports  # to the coordinator
+    self.interval = interval
+    self.migrants = migrants
+    self.blend = blend  # how much of a neighbour's probabilities to mix into ours
+    self.arrived = []
+
+  def say(self, *args, **kwargs):
+    pass  # islands leave the printing to the coordinator
+
+  def report(self, round_num, variant):
+    score, candidate, result = variant
+    self.reports.put((self.index, round_num, score, candidate, result['steps']))
+
+  def arrivals(self, solved):
+    """Candidates from the previous island since the last round, leaving out any this round already has"""
+    seen = {candidate for _, candidate, _ in solved}
+    arrived = [migrant for migrant in self.arrived if migrant[1] not in seen]
+    self.arrived = []
+    return arrived
+
+  def exchange(self, round_num, top, probabilities):
+    """Sends top's best and probabilities on every interval rounds, returning probabilities blended with any received"""
+    if round_num % self.interval == 0:
+      # a copy, since the queue only pickles it later on (on another thread) and gradient_ascent may change it by then
+      self.outbox.put((top[-self.migrants:], [cell[:] for cell in probabilities]))
+
+    while 1:
+      try:
+        migrants, theirs = self.inbox.get_nowait()
+      except queue.Empty:
+        break
+
+      self.arrived.extend(migrants)
+      probabilities = [
+        [(1 - self.blend) * mine + self.blend * other for mine, other in zip(cell, their_cell)]
+        for cell, their_cell in zip(probabilities, theirs)
+      ]
+
+    return probabilities
+
+
+def run_island(island, template_method, score_method, template_args, seed, cache_size, max_rounds, canonical):
+  signal.signal(signal.SIGINT, signal.SIG_IGN)  # ^C is the coordinator's to handle
+  cache = ScoreCache(cache_size) if cache_size else None
+  gradient_ascent(template_method, score_method, *template_args, cache=cache, max_rounds=max_rounds, seed=seed,
+                  island=island, canonical=canonical)
+
+
+def run(template_method, score_method, template_args, islands=None, seed=None, interval=5, migrants=3, blend=0.25,
+        cache_size=256 * 2 ** 20, max_rounds=None, result_log=None, canonical=False):
+  """
+  Runs an island per core (or as many as given) until ^C, returning the best (score, candidate) any of them found, or
+  until they've all died (of an error in the template, say), raising RuntimeError.
+  With a seed, island n gets seed + n. Each new candidate reported goes in result_log, a results.ResultLog, if given.
+  With canonical (see generator.Evaluator), a rotation or reflection of a candidate already reported isn't new either.
+  """
+  template = get_template(template_method, *template_args) if canonical else None
+  islands = islands or multiprocessing.cpu_count()
+  inboxes = [multiprocessing.Queue() for _ in range(islands)]
+  reports = multiprocessing.Queue()
+
+  processes = []
+  for index in range(islands):
+    island = Island(index, inboxes[index], inboxes[(index + 1) % islands], reports, interval, migrants, blend)
+    island_seed = None if seed is None else seed + index
+    processes.append(multiprocessing.Process(
+      target=run_island,
+      args=(island, template_method, score_method, template_args, island_seed, cache_size // islands, max_rounds,
+            canonical),
+      daemon=True,
+    ))
+
+  for process in processes:
+    process.start()
+
+  seen = set()
+  best = None
+
+  try:
+    while 1:
+      try:
+        index, round_num, score, candidate, steps = reports.get(timeout=1)
+      except queue.Empty:
+        if not any(process.is_alive() for process in processes):
+          codes = ', '.join(str(process.exitcode) for process in processes)
+          raise RuntimeError(f'every island has stopped (exit codes {codes})')
+        continue
+
+      form = template.canonical(candidate) if canonical else candidate
+      if form in seen:  # found again, by this island or another
+        continue
+      seen.add(form)
+
+      output = f'Island {index}, round {round_num}: {candidate} with score {score}'
+      print(output + (f' and steps {steps}' if score > 0 else ''))
+
+      if result_log is not None:
+        extra = dict(canonical=form) if canonical else dict()
+        result_log.write(round_num, candidate, score, steps, island=index, **extra)
+
+      if best is None or score > best[0]:
+        best = (score, candidate)
+        print(' ^ Best so far!')
+
+  finally:
+    for process in processes:
+      process.terminate()
+
+    if result_log is not None:
+      result_log.close()
+
+  return best
+
+
+# python islands.py <template_name> <scoring_method> [arg1] [arg2] [...] [--islands N] [--seed N] [--interval N]
+#   [--migrants N] [--blend FRACTION] [--cache-size MB] [--max-rounds N] [--log FILE] [--canonical]
+# runs gradient_ascent (see generator.py) on N processes, one per core by default, trading candidates between them
+
+if __name__ == '__main__':
+  print('argv:', sys.argv)
+
+  parser = argparse.ArgumentParser()
+  parser.add_argument('template_method')
+  parser.add_argument('score_method')
+  parser.add_argument('template_args', nargs='*')
+  parser.add_argument('--islands', type=int, help='number of populations (and processes), one per core by default')
+  parser.add_argument('--seed', type=int, help='seed for the run; island n gets seed + n')
+  parser.add_argument('--interval', type=int, default=5, help='rounds between sending candidates to the next island')
+  parser.add_argument('--migrants', type=int, default=3, help='number of candidates sent each time')
+  parser.add_argument('--blend', type=float, default=0.25, help='how much of a neighbour\'s probabilities to mix in')
+  parser.add_argument('--cache-size', type=float, default=256, help='megabytes of scored candidates to remember, shared out')
+  parser.add_argument('--max-rounds', type=int, help='give up on solves taking more rounds, scoring them -1')
+  parser.add_argument('--log', help='file to append each new candidate to as JSON lines (see results.py)')
+  parser.add_argument('--canonical', action='store_true', help='score rotations and reflections of a candidate once')
+  options = parser.parse_args()
+
+  args = [int(arg) if re.match(r'\d+', arg) else arg for arg in options.template_args]
+  result_log = None
+  if options.log:
+    fields = dict(template=options.template_method, args=args, score_method=options.score_method, seed=options.seed)
+    result_log = ResultLog(options.log, fields)
+
+  try:
+    run(options.template_method, options.score_method, args, options.islands, options.seed, options.interval,
+        options.migrants, options.blend, int(options.cache_size * 2 ** 20), options.max_rounds, result_log,
+        options.canonical)
+  except KeyboardInterrupt:
+    print('^C interrupted!')
@@ -1,43 +1,87 @@
 import re
+import sys
+import mmap
+import struct
+from array import array
+
 from solver import Puzzle
 
+# Not parsing arbitrary XML here! Puzzle files only nest a few levels deep and everything worth reading is the text of
+# an innermost element, so one pass picking out those (and where nodes and hints start and end) covers it
+TOKEN = re.compile(r'<(\w+)>([^<]*)</\1>|<(/?)(NODE|HINT|COLUMN_HINT)>')
+
+
+def read(source):
+  """
+  Reads a puzzle file's contents (or an open puzzle file) in a single pass, pulling out its nodes, column hints, and
+  color hints. This has everything `load` needs to make a solver Puzzle as well as everything needed to render it again.
+  """
+  contents = source if isinstance(source, str) else source.read()
 
-def load(contents, verbose=False):
-  id_map = dict()
+  top = dict()  # the puzzle's own ID, TITLE, etc.
   nodes = []
-  total_mines = 0
-  initial_revealed = []
-
-  # Not parsing arbitrary XML here!
-  matches = re.finditer('<NODE>.*?</NODE>', contents, re.DOTALL)
-  for match in matches:
-    node = match.group(0)
-
-    node_id = re.search('<ID>(.*?)</ID>', node).group(1)
-    neighbor_ids = re.search('<EDGES>(.*?)</EDGES>', node).group(1).split(',')
-    revealed = bool(re.search('<REVEALED>[Tt]rue</REVEALED>', node))
-    has_mine = bool(re.search('<HAS_MINE>[Tt]rue</HAS_MINE>', node))
-    secret = bool(re.search('<SECRET>[Tt]rue</SECRET>', node))
-
-    if neighbor_ids == ['']:  # no neighbors
-      neighbor_ids = []
-    if revealed:
-      initial_revealed.append(node_id)
-    if has_mine:
-      total_mines += 1
-
-    node_info = dict(
-      node_id=node_id,
-      neighbor_ids=neighbor_ids,
-      revealed=revealed,
-      has_mine=has_mine,
-      secret=secret,
-    )
-    id_map[node_id] = len(nodes)
-    nodes.append(node_info)
+  hints = []  # column and color hints together, in the order they're in the file
+  fields = None
+
+  for match in TOKEN.finditer(contents):
+    tag, text, closing, container = match.groups()
+
+    if container and not closing:
+      fields = dict()
+
+    elif container:
+      edges = fields.get('EDGES', '')
+
+      if container == 'NODE':
+        nodes.append(dict(
+          id=fields['ID'],
+          neighbors=edges.split(',') if edges else [],  # no neighbors
+          position=fields.get('POS', '').split(','),
+          points=fields.get('POINTS', ''),
+          revealed=fields.get('REVEALED') in ['True', 'true'],
+          has_mine=fields.get('HAS_MINE') in ['True', 'true'],
+          secret=fields.get('SECRET') in ['True', 'true'],
+        ))
+      elif container == 'HINT':  # that is, a color hint
+        hints.append(dict(
+          ids=fields['IDS'].split(','),
+          color=fields.get('COLOR'),
+          is_dark=fields.get('IS_DARK'),
+        ))
+      else:
+        hints.append(dict(
+          ids=fields['IDS'].split(','),
+          text_location=fields.get('TEXT_LOCATION', '').split(','),
+          text_rotation=fields.get('TEXT_ROTATION'),
+          text_size_factor=fields.get('TEXT_SIZE_FACTOR'),
+        ))
+
+      fields = None
+
+    else:
+      (top if fields is None else fields).setdefault(tag, text)
+
+  return dict(
+    puzzle_id=top.get('ID'),
+    name=top.get('TITLE'),
+    reverse_id_map=[node['id'] for node in nodes],
+    nodes=nodes,
+    hints=hints,
+    columns=[hint for hint in hints if 'color' not in hint],
+    colors=[hint for hint in hints if 'color' in hint],
+  )
+
+
+def load(source, verbose=False):
+  """Makes a solver Puzzle out of a puzzle file's contents, an open puzzle file, or what `read` got out of one"""
+  data = source if isinstance(source, dict) else read(source)
+  nodes = data['nodes']
+  id_map = {node['id']: index for index, node in enumerate(nodes)}
+  total_mines = sum(node['has_mine'] for node in nodes)
+  initial_revealed = [node['id'] for node in nodes if node['revealed']]
 
   # Hack for 94: Gridlock III (that the dev had to do too)
-  if re.search('<ID>(.*?)</ID>', contents).group(1) == '2256502332117638':
+  if data['puzzle_id'] == '2256502332117638':
     initial_revealed = '0,96,33,66,3,35,99,36,37,69,6,39,9,46,26,90,60,93,30,63'.split(',')
 
   board = []
@@ -46,29 +90,27 @@ def load(contents, verbose=False):
 
   for node in nodes:
     cell = [
-      id_map[node['node_id']],
+      id_map[node['id']],
       '*' if node['has_mine'] else '?' if node['secret'] else '.',
-      [id_map[neighbor_id] for neighbor_id in node['neighbor_ids']],
+      [id_map[neighbor_id] for neighbor_id in node['neighbors']],
     ]
     board.append(cell)
 
   constraints.append([total_mines, list(range(len(nodes)))])
   gray_mines = [total_mines, set(range(len(nodes)))]
 
-  hints = re.finditer('<(COLUMN_)?HINT>.*?</(COLUMN_)?HINT>', contents, re.DOTALL)
-  for hint in hints:
+  for hint in data['hints']:
     mapped_ids = []
     mine_count = 0
 
-    ids = re.search('<IDS>(.*?)</IDS>', hint.group(0)).group(1).split(',')
-    for hint_id in ids:
+    for hint_id in hint['ids']:
       hint_id = id_map[hint_id]
       mapped_ids.append(hint_id)
       mine_count += nodes[hint_id]['has_mine']
 
     constraints.append([mine_count, mapped_ids])
 
-    if 'COLUMN' not in hint.group(0):
+    if 'color' in hint:
       gray_mines[0] -= mine_count
       gray_mines[1].difference_update(set(mapped_ids))
 
@@ -85,68 +127,104 @@ def load(contents, verbose=False):
     for constraint in constraints:
       print(' ', constraint)
 
-  name = re.search('<TITLE>(.+?)</TITLE>', contents).group(1)
-  reverse_id_map = [node['node_id'] for node in nodes]
-  return Puzzle(board, revealed, constraints, verbose=verbose), name, reverse_id_map
+  return Puzzle(board, revealed, constraints, verbose=verbose), data['name'], data['reverse_id_map']
 
 
-def extract(contents, verbose=False):
+def extract(source, verbose=False):
   """Takes a puzzle file and pulls nodes, column hints, and color hints out of it"""
-  nodes = []
+  return read(source)
+
+
+# Packed puzzles: a binary sidecar (puzzle.puz -> puzzle.puzb) with just what load makes a Puzzle out of, as
+# little-endian fixed-width arrays so that load_packed can map it and hand out views instead of parsing anything.
+#
+#   header       PACKED_HEADER: magic, version, then the number of nodes, revealed cells, edges, constraints,
+#                constraint cells, and bytes of strings
+#   u32 arrays   edge offsets (nodes + 1), edges, revealed (in load's order), constraint offsets (constraints + 1),
+#                constraint cells, constraint counts
+#   u8 array     each node's '.', '*' or '?'
+#   strings      UTF-8 title, puzzle id, then each node's id, separated by newlines
+PACKED_MAGIC = b'TMPZ'
+PACKED_VERSION = 1
+PACKED_HEADER = struct.Struct('<4s7I')
+
+
+def packed_filename(filename):
+  return filename + 'b'
+
+
+def pack(source):
+  """Packs a puzzle file's contents (or an open puzzle file, or what `read` got out of one) into the packed format"""
+  data = source if isinstance(source, dict) else read(source)
+  puzzle, name, reverse_id_map = load(data)
+  board = sorted(puzzle.board)
+  constraints = puzzle.og_constraints
+
+  edge_offsets = array('I', [0])
+  edges = array('I')
+  for _, _, neighbors in board:
+    edges.extend(neighbors)
+    edge_offsets.append(len(edges))
+
+  constraint_offsets = array('I', [0])
+  constraint_cells = array('I')
+  for _, cells in constraints:
+    constraint_cells.extend(cells)
+    constraint_offsets.append(len(constraint_cells))
+
+  arrays = [
+    edge_offsets,
+    edges,
+    array('I', puzzle.revealed),
+    constraint_offsets,
+    constraint_cells,
+    array('I', [count for count, _ in constraints]),
+  ]
+  if sys.byteorder != 'little':
+    for a in arrays:
+      a.byteswap()
+
+  strings = '\n'.join([name, data['puzzle_id'] or '', *reverse_id_map]).encode('utf-8')
+  header = PACKED_HEADER.pack(
+    PACKED_MAGIC, PACKED_VERSION, len(board), len(puzzle.revealed), len(edges), len(constraints),
+    len(constraint_cells), len(strings),
+  )
+
+  return b''.join([header, *[a.tobytes() for a in arrays], bytes(ord(what) for _, what, _ in board), strings])
+
 
-  # Not parsing arbitrary XML here!
-  matches = re.finditer('<NODE>.*?</NODE>', contents, re.DOTALL)
-  for match in matches:
-    node = match.group(0)
-
-    node_id = re.search('<ID>(.*?)</ID>', node).group(1)
-    neighbor_ids = re.search('<EDGES>(.*?)</EDGES>', node).group(1).split(',')
-    position = re.search('<POS>(.*?)</POS>', node).group(1).split(',')
-    points = re.search('<POINTS>(.*?)</POINTS>', node).group(1)
-    revealed = bool(re.search('<REVEALED>[Tt]rue</REVEALED>', node))
-    has_mine = bool(re.search('<HAS_MINE>[Tt]rue</HAS_MINE>', node))
-    secret = bool(re.search('<SECRET>[Tt]rue</SECRET>', node))
-
-    if neighbor_ids == ['']:  # no neighbors
-      neighbor_ids = []
-
-    nodes.append(dict(
-      id=node_id,
-      neighbors=neighbor_ids,
-      position=position,
-      points=points,
-      revealed=revealed,
-      has_mine=has_mine,
-      secret=secret,
-    ))
-
-  columns = []
-  colors = []
-  hints = re.finditer('<(COLUMN_)?HINT>.*?</(COLUMN_)?HINT>', contents, re.DOTALL)
-  for hint in hints:
-    hint_src = hint.group(0)
-    ids = re.search('<IDS>(.*?)</IDS>', hint_src).group(1).split(',')
-
-    if 'COLUMN' not in hint.group(0):  # that is, a color hint
-      colors.append(dict(
-        ids=ids,
-        color=re.search('<COLOR>(.*?)</COLOR>', hint_src).group(1),
-        is_dark=re.search('<IS_DARK>(.*?)</IS_DARK>', hint_src).group(1),
-      ))
+def load_packed(filename, verbose=False):
+  """
+  Like load, but for a packed puzzle file (see pack). The file is memory-mapped and the neighbor and constraint cell
+  lists handed to Puzzle are read-only views into it, so nothing is parsed or copied besides the board's rows.
+  """
+  with open(filename, 'rb') as f:
+    buffer = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+  magic, version, num_nodes, num_revealed, num_edges, num_constraints, num_cells, strings_size = \
+    PACKED_HEADER.unpack_from(buffer)
+  if magic != PACKED_MAGIC or version != PACKED_VERSION:
+    raise ValueError(f'{filename} is not a version {PACKED_VERSION} packed puzzle')
+
+  position = PACKED_HEADER.size
+  sections = []
+  for length in [num_nodes + 1, num_edges, num_revealed, num_constraints + 1, num_cells, num_constraints]:
+    section = buffer[position:position + 4 * length]
+    if sys.byteorder == 'little':
+      sections.append(section.cast('I'))
     else:
-      columns.append(dict(
-        ids=ids,
-        text_location=re.search('<TEXT_LOCATION>(.*?)</TEXT_LOCATION>', hint_src).group(1).split(','),
-        text_rotation=re.search('<TEXT_ROTATION>(.*?)</TEXT_ROTATION>', hint_src).group(1),
-        text_size_factor=re.search('<TEXT_SIZE_FACTOR>(.*?)</TEXT_SIZE_FACTOR>', hint_src).group(1),
-      ))
-
-  name = re.search('<TITLE>(.+?)</TITLE>', contents).group(1)
-  reverse_id_map = [node['id'] for node in nodes]
-  return dict(
-    name=name,
-    reverse_id_map=reverse_id_map,
-    nodes=nodes,
-    columns=columns,
-    colors=colors,
-  )
+      sections.append(array('I', section))
+      sections[-1].byteswap()
+    position += 4 * length
+
+  edge_offsets, edges, revealed, constraint_offsets, constraint_cells, counts = sections
+  cells = bytes(buffer[position:position + num_nodes]).decode('ascii')
+  name, _, *reverse_id_map = bytes(buffer[position + num_nodes:position + num_nodes + strings_size]).decode('utf-8').split('\n')
+
+  board = [[tile_id, cells[tile_id], edges[edge_offsets[tile_id]:edge_offsets[tile_id + 1]]] for tile_id in range(num_nodes)]
+  constraints = [
+    [counts[index], constraint_cells[constraint_offsets[index]:constraint_offsets[index + 1]]]
+    for index in range(num_constraints)
+  ]
+
+  return Puzzle(board, list(revealed), constraints, verbose=verbose), name, reverse_id_map
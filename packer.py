@@ -0,0 +1,45 @@
+import os
+import sys
+import glob
+
+from atomic import atomic_write
+from loader import pack, packed_filename
+
+
+def convert(filename, force=False):
+  """Writes filename's packed sidecar unless there's already one at least as new, returning whether it did"""
+  target = packed_filename(filename)
+  if not force and os.path.exists(target) and os.path.getmtime(target) >= os.path.getmtime(filename):
+    return False
+
+  with open(filename) as f:
+    packed = pack(f)
+
+  # written whole or not at all, so nothing ever maps a half-written file
+  atomic_write(target, lambda f: f.write(packed), 'wb')
+
+  return True
+
+
+def run(folders, force=False):
+  converted = 0
+  skipped = 0
+
+  for folder in folders:
+    for filename in sorted(glob.glob(os.path.join(folder, '**', '*.puz'), recursive=True)):
+      if convert(filename, force):
+        converted += 1
+      else:
+        skipped += 1
+
+  print(f'packed {converted} puzzles ({skipped} already up to date)')
+
+
+# python packer.py [folder] [...] [--force]
+# writes a packed sidecar (puzzle.puz -> puzzle.puzb, see loader.pack) next to every puzzle file in the given folders,
+# /puzzles and /published by default, which loader.load_packed can then map instead of parsing the XML
+# sidecars newer than their puzzle files are left alone unless --force is given
+
+if __name__ == '__main__':
+  args = [arg for arg in sys.argv[1:] if arg != '--force']
+  run(args or ['puzzles', 'published'], force='--force' in sys.argv)
@@ -0,0 +1,157 @@
+"""
+An append-only log of generator results, one JSON object per line, and ways to read it back.
+
+Each record is a round's best candidate: when it was found, which run (template, args, scoring method) and round it
+came from, its score and steps, and how many solver rounds those steps took. Readers go through the file a line at a
+time, so finding the best few candidates in a log of any size takes next to no memory.
+"""
+
+import os
+import sys
+import json
+import time
+import heapq
+import argparse
+from collections import deque
+
+
+class ResultLog(object):
+  """
+  Appends records to filename, writing them out every `batch` records or `interval` seconds (whichever comes first)
+  and on close. Fields in `run` go into every record.
+  """
+
+  def __init__(self, filename, run=None, batch=64, interval=60):
+    self.filename = filename
+    self.run = run or dict()
+    self.batch = batch
+    self.interval = interval
+    self.pending = []
+    self.flushed = time.monotonic()
+
+  def write(self, round_num, candidate, score, steps, **extra):
+    record = dict(self.run, time=time.time(), round=round_num, candidate=candidate, score=score, steps=steps,
+                  rounds=len(steps), **extra)
+    self.pending.append(json.dumps(record, sort_keys=True) + '\n')
+
+    if len(self.pending) >= self.batch or time.monotonic() - self.flushed >= self.interval:
+      self.flush()
+
+  def flush(self):
+    if self.pending:
+      with open(self.filename, 'a') as f:
+        f.write(''.join(self.pending))
+      self.pending = []
+
+    self.flushed = time.monotonic()
+
+  def close(self):
+    self.flush()
+
+
+def read(filename, offset=0):
+  """
+  Yields (record, offset after it) for each complete line from byte offset on. A line still being written (no newline
+  yet) is left for next time.
+  """
+  with open(filename, 'rb') as f:
+    f.seek(offset)
+
+    for line in f:
+      if not line.endswith(b'\n'):
+        break
+
+      offset += len(line)
+      if line.strip():
+        yield json.loads(line), offset
+
+
+def tail(filename, follow=False, poll=1.0, last=10):
+  """
+  Yields the last `last` records, then (with follow) each new one as it's appended, checking every poll seconds.
+  Starts far enough from the end to find them without reading the whole file.
+  """
+  size = os.path.getsize(filename)
+  start = size
+
+  # go back a chunk at a time until there are enough whole lines after start
+  while start > 0:
+    start = max(0, start - 64 * 1024 * (1 + last // 100))
+    with open(filename, 'rb') as f:
+      f.seek(start)
+      chunk = f.read(size - start)
+
+    if chunk.count(b'\n') > last or start == 0:
+      if start > 0:  # skip to the first whole line
+        start += chunk.index(b'\n') + 1
+      break
+
+  recent = deque(maxlen=last)
+  offset = start
+  for record, offset in read(filename, start):
+    recent.append(record)
+  yield from recent
+
+  while follow:
+    time.sleep(poll)
+    for record, offset in read(filename, offset):
+      yield record
+
+
+def top(filename, k=10, key='score', **match):
+  """
+  The k records with the highest key, best first, counting each candidate once (and its rotations and reflections, for
+  runs logging a canonical form). Only records whose fields equal those in match (template='combination_lock', say)
+  count.
+  """
+  heap = []  # (key, candidate, record), smallest first
+  kept = set()
+
+  for record, _ in read(filename):
+    if any(record.get(field) != value for field, value in match.items()):
+      continue
+
+    candidate = record.get('canonical', record['candidate'])
+    if candidate in kept:  # found again; it scores the same every time
+      continue
+
+    entry = (record[key], candidate, record)
+    if len(heap) < k:
+      heapq.heappush(heap, entry)
+      kept.add(candidate)
+    elif entry[:2] > heap[0][:2]:
+      kept.discard(heapq.heapreplace(heap, entry)[1])
+      kept.add(candidate)
+
+  return [record for _, _, record in sorted(heap, key=lambda entry: entry[:2], reverse=True)]
+
+
+def describe(record):
+  return f"{record['candidate']} with score {record['score']} and steps {record['steps']} (round {record['round']})"
+
+
+# python results.py <log_file> [--top K] [--template NAME] [--follow]
+# prints the K best candidates in a log written by generator.py/islands.py --log,
+# or with --follow, the last few and then each new one as it comes in
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('filename')
+  parser.add_argument('--top', type=int, default=10, help='number of candidates to list')
+  parser.add_argument('--template', help='only list candidates for this template')
+  parser.add_argument('--follow', action='store_true', help='keep printing new candidates as they\'re logged')
+  options = parser.parse_args()
+
+  match = dict(template=options.template) if options.template else dict()
+
+  try:
+    if options.follow:
+      for record in tail(options.filename, follow=True, last=options.top):
+        if all(record.get(field) == value for field, value in match.items()):
+          print(describe(record))
+          sys.stdout.flush()
+    else:
+      for record in top(options.filename, options.top, **match):
+        print(describe(record))
+  except KeyboardInterrupt:
+    pass
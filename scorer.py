@@ -1,68 +1,109 @@
 from math import log
 
 
-def lognum(result):
-  total_score = 0
-  for step in result['summary']:
+class Accumulator(object):
+  """
+  Scores a solve one round summary at a time, so it can be fed while the solver runs. Subclasses add to total in add;
+  steps is the run of T/E/I letters (trivial, exact or inexact) for the rounds seen so far.
+  """
+
+  def __init__(self):
+    self.total = 0
+    self.rounds = 0
+    self.letters = []
+
+  def feed(self, summary):
+    """Adds whichever steps of summary haven't been added yet, so the same growing list can be fed every round"""
+    for step in summary[self.rounds:]:
+      self.rounds += 1
+      self.letters.append('T' if 'trivial' in step else 'E' if 'exact' in step else 'I')
+      self.add(step)
+
+    return self
+
+  @property
+  def steps(self):
+    return ''.join(self.letters)
+
+  def add(self, step):
+    raise NotImplementedError
+
+  def score(self, solved):
+    return self.total if solved else -1
+
+
+class Lognum(Accumulator):
+  # the last step of a solve that got stuck can have used none, but that solve scores -1 anyway
+
+  def add(self, step):
     if 'trivial' in step:
-      total_score += 1
+      self.total += 1
     elif 'exact' in step:
-      total_score += log(step['exact']['count'])
+      self.total += log(step['exact']['count']) if step['exact']['count'] else 0
     elif 'inexact' in step:
-      total_score += log(step['inexact']['count'])
-
-  return total_score
+      self.total += log(step['inexact']['count']) if step['inexact']['count'] else 0
 
 
-def seqnum(result):
-  total_score = 0
+class Seqnum(Accumulator):
+  def __init__(self):
+    super().__init__()
+    self.trivial_count = 0
+    self.exact_count = 0
+    self.exact_total = 0
+    self.inexact_count = 0
+    self.inexact_total = 0
 
-  trivial_count = 0
-  exact_count = 0
-  exact_total = 0
-  inexact_count = 0
-  inexact_total = 0
-
-  for step in result['summary']:
+  def add(self, step):
     if 'trivial' in step:
-      trivial_count += 1
-      # total_score += 1 / 2 ** trivial_count
-      # total_score += 1 / trivial_count
-      # total_score += 1
-    elif trivial_count:
-      total_score += 1
-      trivial_count = 0
+      self.trivial_count += 1
+      # self.total += 1 / 2 ** self.trivial_count
+      # self.total += 1 / self.trivial_count
+      # self.total += 1
+    elif self.trivial_count:
+      self.total += 1
+      self.trivial_count = 0
 
     if 'exact' in step:
-      exact_count += 1
-      exact_total += step['exact']['count']
-    elif exact_count:
-      # total_score += 2 ** exact_count - 1
-      # total_score += exact_total
-      total_score += exact_count ** 2
-      exact_count = 0
-      exact_total = 0
+      self.exact_count += 1
+      self.exact_total += step['exact']['count']
+    elif self.exact_count:
+      # self.total += 2 ** self.exact_count - 1
+      # self.total += self.exact_total
+      self.total += self.exact_count ** 2
+      self.exact_count = 0
+      self.exact_total = 0
 
     if 'inexact' in step:
-      inexact_count += 1
-      inexact_total += step['inexact']['count']
-    elif inexact_count:
-      # total_score += 2 / (2 ** inexact_count - 1)
-      # total_score += inexact_total / inexact_count
-      total_score += 10 * inexact_count
-      inexact_count = 0
-      inexact_total = 0
+      self.inexact_count += 1
+      self.inexact_total += step['inexact']['count']
+    elif self.inexact_count:
+      # self.total += 2 / (2 ** self.inexact_count - 1)
+      # self.total += self.inexact_total / self.inexact_count
+      self.total += 10 * self.inexact_count
+      self.inexact_count = 0
+      self.inexact_total = 0
+
+
+methods = dict(
+  lognum=Lognum,
+  seqnum=Seqnum,
+)
 
-  return total_score
+
+def accumulator(method):
+  return methods[method]()
+
+
+def lognum(result):
+  return Lognum().feed(result['summary']).total
+
+
+def seqnum(result):
+  return Seqnum().feed(result['summary']).total
 
 
 def score(result, method):
   if not result['solved']:
     return -1
 
-  methods = dict(
-    lognum=lognum,
-    seqnum=seqnum,
-  )
-
-  return methods[method](result)
+  return accumulator(method).feed(result['summary']).total
@@ -22,25 +22,60 @@ Assumptions/conditions:
 * Revealing a mine means immediate failure.
 """
 
+import time
+
+from cellsets import popcount, bits, from_cells, to_cells, LazyCells
+
+STAGES = ['adjust', 'trivial', 'exact', 'inexact']
+
 
 def cells_to_binary(cells):
-  num = 0
-  for x in cells:
-    num += 2 ** x
-  return num
+  return from_cells(cells)
 
 
 def binary_to_cells(num):
-  cells = set()
+  return to_cells(num)
+
+
+def copy_indexes(indexes):
+  return {
+    'trivial': set(indexes['trivial']),
+    'exact': {bit: set(nums) for bit, nums in indexes['exact'].items()},
+    'inexact': {bit: set(nums) for bit, nums in indexes['inexact'].items()},
+    'stale': {bit: set(nums) for bit, nums in indexes['stale'].items()},
+  }
+
+
+def add_profile(totals, profile):
+  """
+  Adds up a result's per-round profile (from Puzzle(profile=True)) into totals, a dict of stage name to sums that
+  starts out empty and can be shared across any number of solves
+  """
+  for stages in profile:
+    for stage in STAGES:
+      if stage not in stages:
+        continue
+
+      counts = stages[stage]
+      total = totals.setdefault(stage, dict(rounds=0, time=0.0, pairs=0, added=0, tightened=0, peak_ineqs=0))
+      total['rounds'] += 1
+      total['time'] += counts['time']
+      total['pairs'] += counts['pairs']
+      total['added'] += counts['added']
+      total['tightened'] += counts['tightened']
+      total['peak_ineqs'] = max(total['peak_ineqs'], counts['peak_ineqs'])
 
-  i, j = 0, 1
-  while j <= num:
-    if j & num:
-      cells.add(i)
+  return totals
 
-    i, j = i + 1, j * 2
 
-  return cells
+def format_profile(totals):
+  lines = ['stage      rounds     time (s)         pairs         added     tightened  peak ineqs']
+  for stage in STAGES:
+    if stage in totals:
+      t = totals[stage]
+      lines.append(f"{stage:<8} {t['rounds']:>8} {t['time']:>12.3f} {t['pairs']:>13} {t['added']:>13} {t['tightened']:>13} {t['peak_ineqs']:>11}")
+
+  return '\n'.join(lines)
 
 
 class Puzzle(object):
@@ -75,13 +110,19 @@ class Puzzle(object):
   ]
   """
 
-  def __init__(self, board, revealed, constraints, verbose=False, max_inexact_stages=-1):
+  def __init__(self, board, revealed, constraints, verbose=False, max_inexact_stages=-1, profile=False, max_rounds=None, scorer=None):
+    # scorer: a scorer.Accumulator, fed each round's summary as the solve goes
+    # max_rounds: stop early (the result is marked pruned) once a solve has taken that many rounds
     self.board = board
     self.revealed = revealed
     self.og_constraints = constraints
     self.constraints = self.convert_constraints(constraints)
     self.verbose = verbose
     self.max_inexact_stages = max_inexact_stages
+    self.profile = profile
+    self.counts = None
+    self.max_rounds = max_rounds
+    self.scorer = scorer
 
     self.flagged = []
     self.newly_revealed = []
@@ -90,13 +131,14 @@ class Puzzle(object):
 
   def convert_constraints(self, constraints):
     converted = []
+    revealed = set(self.revealed)
 
     for constraint in constraints:
       cells = []
       count = constraint[0]
 
       for c in constraint[1]:
-        if c not in self.revealed:
+        if c not in revealed:
           cells.append(c)
 
       if cells:
@@ -105,17 +147,12 @@ class Puzzle(object):
     return converted
 
   def index_add_remove(self, index, action, num):
-    n = 1
-    while n <= num:
-      if n & num:
-
-        if action == 'add':
-          index.setdefault(n, set()).add(num)
-        elif action == 'remove':
-          if n in index and num in index[n]:
-            index[n].remove(num)
-
-      n *= 2
+    for n in bits(num):
+      if action == 'add':
+        index.setdefault(n, set()).add(num)
+      elif action == 'remove':
+        if n in index and num in index[n]:
+          index[n].remove(num)
 
   def add_ineq(self, to_add, ineqs, indexes):
     if to_add[1] == 0 and to_add[2] == to_add[3]:  # Number of mines in X cells is [0, X]
@@ -138,6 +175,9 @@ class Puzzle(object):
     else:
       known = ineqs[num] = to_add[1:]
 
+    if self.counts is not None:
+      self.counts['tightened' if old else 'added'] += 1
+
     if known[1] == 0 or known[0] == known[2]:
       indexes['trivial'].add(num)
       return known, True
@@ -165,7 +205,7 @@ class Puzzle(object):
     to_add = []
 
     shared_num = left & right
-    shared_count = bin(shared_num).count('1')
+    shared_count = popcount(shared_num)
     shared_bounds = [
       max(0, left_bounds[0] - left_bounds[2] + shared_count, right_bounds[0] - right_bounds[2] + shared_count),
       min(shared_count, left_bounds[1], right_bounds[1]),
@@ -177,7 +217,7 @@ class Puzzle(object):
       nleft_bounds = [
         max(0, left_bounds[0] - shared_bounds[1]),
         min(left_bounds[2] - shared_count, max(0, left_bounds[1] - shared_bounds[0])),
-        bin(nleft_num).count('1'),
+        popcount(nleft_num),
       ]
       to_add.append([nleft_num] + nleft_bounds)
 
@@ -186,26 +226,28 @@ class Puzzle(object):
       nright_bounds = [
         max(0, right_bounds[0] - shared_bounds[1]),
         min(right_bounds[2] - shared_count, max(0, right_bounds[1] - shared_bounds[0])),
-        bin(nright_num).count('1'),
+        popcount(nright_num),
       ]
       to_add.append([nright_num] + nright_bounds)
 
     return to_add
 
-  def cross_all_pairs(self, left_index, right_index, ineqs, indexes, max_cells=9, max_mines=3):
+  def cross_all_pairs(self, left_index, right_index, ineqs, indexes, max_cells=9, max_mines=3, crossed_pairs=None):
+    # crossed_pairs: pairs (with their bounds) crossed before; crossing one again can only re-add what's already there
     any_added = False
-    num = 1
-    seen = 0
+    if crossed_pairs is None:
+      crossed_pairs = set()
 
     if self.verbose:
       print()
 
-    while num <= max(left_index):
-      if num not in left_index or num not in right_index:
-        seen = seen | num
-        num *= 2
+    # pairs are crossed in the bucket of the lowest bit they share, i.e. skipped if they share any lower bit
+    for num in sorted(left_index):
+      if num not in right_index:
         continue
 
+      seen = num - 1
+
       lefts = left_index[num]
       rights = right_index[num].copy()
 
@@ -225,6 +267,18 @@ class Puzzle(object):
           if right_bounds is None or right_bounds[2] > max_cells and right_bounds[0] > max_mines:
             continue
 
+          if left < right:
+            pair = (left, left_bounds[0], left_bounds[1], right, right_bounds[0], right_bounds[1])
+          else:
+            pair = (right, right_bounds[0], right_bounds[1], left, left_bounds[0], left_bounds[1])
+
+          if pair in crossed_pairs:
+            continue
+          crossed_pairs.add(pair)
+
+          if self.counts is not None:
+            self.counts['pairs'] += 1
+
           if self.verbose:
             rightstr = f'{binary_to_cells(right)} {right_bounds}'
 
@@ -242,32 +296,19 @@ class Puzzle(object):
                 rightstr = ''
               print('  ', '+' if added else '_', binary_to_cells(new_ineq[0]), new_ineq[1:])
 
-      seen = seen | num
-      num *= 2
-
     if self.verbose:
       print()
 
     return any_added
 
-  def solve(self):
-    ineqs = dict()
-    max_cells = 9
-    max_mines = 3
+  def what(self, cell):
+    return next(what for tile_id, what, _ in self.board if tile_id == cell)
 
-    indexes = {
-      'trivial': set(),
-      'exact': dict(),
-      'inexact': dict(),
-      'stale': dict(),
-    }
-
-    for const in self.constraints:
-      self.add_ineq(const, ineqs, indexes)
-
-    revealed = cells_to_binary(self.revealed)
-    flagged = 0
+  def mines(self):
+    return cells_to_binary([tile_id for tile_id, what, _ in self.board if what == '*'])
 
+  def make_board_ineqs(self):
+    # only ever looked up with get(), so MaskPuzzle can hand out anything that has one
     self.board.sort()
     board_ineqs = dict()
     for tile_id, what, neighbors in self.board:
@@ -276,12 +317,45 @@ class Puzzle(object):
         count = 0
 
         for neighbor in neighbors:
-          cells += 2 ** neighbor
+          cells += 1 << neighbor
           if self.board[neighbor][1] == '*':
             count += 1
 
         if cells:
-          board_ineqs[2 ** tile_id] = [cells, count, count, bin(cells).count('1')]
+          board_ineqs[1 << tile_id] = [cells, count, count, popcount(cells)]
+
+    return board_ineqs
+
+  def checkpoint(self, round_num, ineqs, indexes, revealed, flagged, inexact_stages, exact):
+    """
+    Copies everything the round loop needs to pick up again at round_num. It's taken once the adjust stage is done,
+    which does nothing when run again on what it left.
+    """
+    return dict(
+      round_num=round_num,
+      ineqs={num: bounds[:] for num, bounds in ineqs.items()},
+      indexes=copy_indexes(indexes),
+      revealed=revealed,
+      flagged=flagged,
+      inexact_stages=inexact_stages,
+      exact=exact,  # never mutated once it's been swapped out of indexes
+    )
+
+  def solve(self, checkpoint=False):
+    ineqs = dict()
+
+    indexes = {
+      'trivial': set(),
+      'exact': dict(),
+      'inexact': dict(),
+      'stale': dict(),
+    }
+
+    for const in self.constraints:
+      self.add_ineq(const, ineqs, indexes)
+
+    revealed = cells_to_binary(self.revealed)
+    board_ineqs = self.make_board_ineqs()
 
     if self.verbose:
       print('board_ineqs:')
@@ -289,7 +363,7 @@ class Puzzle(object):
         print(f'  {tile} - {binary_to_cells(num)} {bounds}')
 
     for tile in self.revealed:
-      ineq = board_ineqs.pop(2 ** tile, None)
+      ineq = board_ineqs.get(1 << tile)
 
       if self.verbose:
         print('adding board ineq:', tile, binary_to_cells(ineq[0]), ineq[1:])
@@ -302,14 +376,88 @@ class Puzzle(object):
       for num, bounds in ineqs.items():
         print(f'  {binary_to_cells(num)} {bounds}')
 
-    inexact_stages = self.max_inexact_stages
+    start = dict(
+      ineqs=ineqs,
+      indexes=indexes,
+      revealed=revealed,
+      flagged=0,
+      inexact_stages=self.max_inexact_stages,
+      exact=None,
+    )
+
+    return self.run(start, board_ineqs, [], [] if checkpoint else None)
+
+  def resolve(self, previous, cell):
+    """
+    Solves this puzzle given the result of `solve(checkpoint=True)` on a layout that differs only at `cell`.
+
+    A cell's own count only matters once it's been revealed, so if `cell` just switched between '.' and '?', every
+    round before the (trivial) one that revealed it plays out exactly as before and is picked up from that round's
+    checkpoint.
+    Any other change (a mine moved, the cell was revealed from the start), or a previous solve that was pruned, falls
+    back to a full solve.
+    """
+    bit = 1 << cell
+    what = self.what(cell)
+    checkpoints = previous.get('checkpoints')
+
+    if checkpoints is None or cell in self.revealed or bool(previous['mines'] & bit) != (what == '*'):
+      return self.solve()
+
+    if previous.get('pruned'):  # cut short, so where it stopped says nothing about whether the cell would have come up
+      return self.solve()
+
+    if not previous.mask('revealed') & bit:  # its count never came up, so nothing changes
+      if self.scorer is not None:
+        self.scorer.feed(previous['summary'])
+
+      return LazyCells(
+        dict(solved=previous['solved'], summary=previous['summary']),
+        dict(revealed=previous.mask('revealed'), flagged=previous.mask('flagged')),
+      )
+
+    # the last checkpoint without the cell revealed is from the round that revealed it
+    saved = next(saved for saved in reversed(checkpoints) if not saved['revealed'] & bit)
+
+    start = dict(saved)
+    start['ineqs'] = {num: bounds[:] for num, bounds in saved['ineqs'].items()}
+    start['indexes'] = copy_indexes(saved['indexes'])
+
+    return self.run(start, self.make_board_ineqs(), previous['summary'][:saved['round_num']])
+
+  def start_stage(self, ineqs):
+    if self.profile:
+      self.counts = dict(time=time.perf_counter(), pairs=0, added=0, tightened=0, peak_ineqs=len(ineqs))
+
+  def end_stage(self, profile, stage, ineqs):
+    if self.counts is not None:
+      self.counts['time'] = time.perf_counter() - self.counts['time']
+      self.counts['peak_ineqs'] = max(self.counts['peak_ineqs'], len(ineqs))
+      profile[-1][stage] = self.counts
+      self.counts = None
+
+  def run(self, start, board_ineqs, summary, checkpoints=None):
+    ineqs = start['ineqs']
+    indexes = start['indexes']
+    revealed = start['revealed']
+    flagged = start['flagged']
+    inexact_stages = start['inexact_stages']
+    exact = start['exact']
+    max_cells = 9
+    max_mines = 3
+    crossed_pairs = set()
+    profile = [] if self.profile else None  # per round: each stage's time, pairs crossed, ineqs added/tightened
+    pruned = False
     finished = False
-    summary = []
 
     while not finished:
+      if profile is not None:
+        profile.append(dict(round=len(summary)))
+
       finished = True
 
       # Stage: adjust
+      self.start_stage(ineqs)
       to_add = []
       to_remove = []
 
@@ -322,8 +470,8 @@ class Puzzle(object):
           if not new_num:
             continue
 
-          flagged_count = bin(num & flagged).count('1')
-          new_count = bin(new_num).count('1')
+          flagged_count = popcount(num & flagged)
+          new_count = popcount(new_num)
           new_min = max([0, bounds[0] - flagged_count])
           new_max = min([new_count, max([0, bounds[1] - flagged_count])])
 
@@ -336,15 +484,28 @@ class Puzzle(object):
         _, added = self.add_ineq(new_ineq, ineqs, indexes)
         finished = finished and not added
 
+      self.end_stage(profile, 'adjust', ineqs)
+
       if not ineqs:
         break
 
+      if self.scorer is not None:
+        self.scorer.feed(summary)
+
+      if self.max_rounds is not None and len(summary) >= self.max_rounds:
+        pruned = True
+        break
+
       summary.append(dict(num_ineqs=len(ineqs)))
       if self.verbose:
         print('num ineqs:', summary[-1]['num_ineqs'])
 
       # Stage: use trivial
       if indexes['trivial']:
+        if checkpoints is not None:  # only trivial steps reveal cells, so only they are ever picked up from
+          checkpoints.append(self.checkpoint(len(summary) - 1, ineqs, indexes, revealed, flagged, inexact_stages, exact))
+
+        self.start_stage(ineqs)
         inexact_stages = self.max_inexact_stages
         newly_revealed = 0
         newly_flagged = 0
@@ -373,31 +534,29 @@ class Puzzle(object):
             newly_flagged = newly_flagged | new_flag
             flagged = flagged | new_flag
 
-        summary[-1]['trivial'] = dict(revealed=binary_to_cells(newly_revealed), flagged=binary_to_cells(newly_flagged))
+        summary[-1]['trivial'] = LazyCells(masks=dict(revealed=newly_revealed, flagged=newly_flagged))
         if self.verbose:
           print('newly_revealed:', summary[-1]['trivial']['revealed'])
           print('newly_flagged:', summary[-1]['trivial']['flagged'])
 
-        n = 1
-        newly_changed = newly_revealed | newly_flagged
-        while n <= newly_changed:
-          if n & newly_changed:
-            indexes['exact'].pop(n, None)
-            indexes['inexact'].pop(n, None)
-            indexes['stale'].pop(n, None)
+        for n in bits(newly_revealed | newly_flagged):
+          indexes['exact'].pop(n, None)
+          indexes['inexact'].pop(n, None)
+          indexes['stale'].pop(n, None)
 
-          if n & newly_revealed and n in board_ineqs:
-            ineq, added = self.add_ineq(board_ineqs[n], ineqs, indexes)
+          board_ineq = board_ineqs.get(n) if n & newly_revealed else None
+          if board_ineq is not None:
+            ineq, added = self.add_ineq(board_ineq, ineqs, indexes)
 
             if self.verbose:
-              print('added, n, board ineq:', added, n, binary_to_cells(board_ineqs[n][0]), ineq)
-
-          n *= 2
+              print('added, n, board ineq:', added, n, binary_to_cells(board_ineq[0]), ineq)
 
+        self.end_stage(profile, 'trivial', ineqs)
         finished = False
         continue
 
       if indexes['exact']:
+        self.start_stage(ineqs)
         inexact_stages = self.max_inexact_stages
         exact = indexes['exact']
         indexes['exact'] = dict()
@@ -406,13 +565,14 @@ class Puzzle(object):
         if self.verbose:
           print('num exact:', summary[-1]['exact']['count'])
 
-        added = self.cross_all_pairs(exact, exact, ineqs, indexes, max_cells, max_mines)
-        added = self.cross_all_pairs(exact, indexes['inexact'], ineqs, indexes, max_cells, max_mines) or added
-        added = self.cross_all_pairs(exact, indexes['stale'], ineqs, indexes, max_cells, max_mines) or added
+        added = self.cross_all_pairs(exact, exact, ineqs, indexes, max_cells, max_mines, crossed_pairs)
+        added = self.cross_all_pairs(exact, indexes['inexact'], ineqs, indexes, max_cells, max_mines, crossed_pairs) or added
+        added = self.cross_all_pairs(exact, indexes['stale'], ineqs, indexes, max_cells, max_mines, crossed_pairs) or added
 
         for bit, nums in exact.items():
           indexes['stale'].setdefault(bit, set()).update(nums)
 
+        self.end_stage(profile, 'exact', ineqs)
         finished = finished and not added
         if added:
           continue
@@ -432,12 +592,14 @@ class Puzzle(object):
           break
         inexact_stages -= 1
 
-        added = self.cross_all_pairs(inexact, inexact, ineqs, indexes, max_cells, max_mines)
-        added = self.cross_all_pairs(inexact, indexes['stale'], ineqs, indexes, max_cells, max_mines) or added
+        self.start_stage(ineqs)
+        added = self.cross_all_pairs(inexact, inexact, ineqs, indexes, max_cells, max_mines, crossed_pairs)
+        added = self.cross_all_pairs(inexact, indexes['stale'], ineqs, indexes, max_cells, max_mines, crossed_pairs) or added
 
         for bit, nums in inexact.items():
           indexes['stale'].setdefault(bit, set()).update(nums)
 
+        self.end_stage(profile, 'inexact', ineqs)
         finished = finished and not added
 
     if self.verbose:
@@ -448,11 +610,76 @@ class Puzzle(object):
       for num, bounds in ineqs.items():
         print('  ', binary_to_cells(num), bounds)
 
-    result = dict(
-      solved=not bool(ineqs),
-      revealed=binary_to_cells(revealed),
-      flagged=binary_to_cells(flagged),
-      summary=summary,
+    if self.scorer is not None:
+      self.scorer.feed(summary)
+
+    # revealed/flagged (here and in each trivial step) stay bitmasks until something looks at them
+    result = LazyCells(
+      dict(solved=not bool(ineqs), summary=summary),
+      dict(revealed=revealed, flagged=flagged),
     )
 
+    if pruned:  # not solved, but only because it was cut short
+      result['pruned'] = True
+
+    if profile is not None:
+      result['profile'] = profile
+
+    if checkpoints is not None:
+      result['checkpoints'] = checkpoints
+      result['mines'] = self.mines()
+
     return result
+
+
+class BoardHints(object):
+  """
+  Stands in for the dict make_board_ineqs builds, for a board given as bitmasks: the inequality each '.' cell's count
+  gives is only worked out if that cell actually gets revealed.
+  """
+
+  def __init__(self, neighbor_masks, mines, clear):
+    self.neighbor_masks = neighbor_masks  # each cell's bit -> its neighbors' bits
+    self.mines = mines
+    self.clear = clear  # the '.' cells
+
+  def get(self, bit, default=None):
+    cells = self.neighbor_masks.get(bit, 0) if bit & self.clear else 0
+    if not cells:
+      return default
+
+    count = popcount(cells & self.mines)
+    return [cells, count, count, popcount(cells)]
+
+  def items(self):
+    for bit in bits(self.clear):
+      ineq = self.get(bit)
+      if ineq is not None:
+        yield bit, ineq
+
+
+class MaskPuzzle(Puzzle):
+  """
+  A Puzzle for a board given as bitmasks instead of lists: neighbor_masks maps each cell's bit to its neighbors' bits,
+  mines and clear are the '*' and '.' cells, and constraints are (cells, count) pairs with the revealed cells already
+  left out of cells. Solves exactly like a Puzzle of the same board, without building anything per cell.
+  """
+
+  def __init__(self, neighbor_masks, mines, clear, revealed, constraints, **kwargs):
+    self.neighbor_masks = neighbor_masks
+    self.mine_mask = mines
+    self.clear = clear
+    super().__init__(None, revealed, constraints, **kwargs)
+
+  def convert_constraints(self, constraints):
+    return [[cells, count, count, popcount(cells)] for cells, count in constraints if cells]
+
+  def what(self, cell):
+    bit = 1 << cell
+    return '*' if self.mine_mask & bit else '.' if self.clear & bit else '?'
+
+  def mines(self):
+    return self.mine_mask
+
+  def make_board_ineqs(self):
+    return BoardHints(self.neighbor_masks, self.mine_mask, self.clear)
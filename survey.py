@@ -0,0 +1,242 @@
+"""
+Surveys a template exhaustively: every layout of '.', '*' and '?' over its cells, solved and scored.
+
+Layout n is n written in base 3 with one digit per cell, most significant first ('.' = 0, '*' = 1, '?' = 2), so the
+survey is just the range 0 .. 3^cells. Layouts that are the same as a smaller one under a symmetry of the template
+(a rotation or reflection of its grid, see templater.Template.symmetries) are skipped, and the ones that are kept are
+weighted by how many layouts they stand for. Layouts that fail the template's sanity_check aren't solved either.
+
+The solver doesn't always take exactly the same route through a layout and its mirror image, since which pairs of
+inequalities it crosses first depends on how the cells are numbered, so a kept layout's score stands in for ones that
+could occasionally score differently: none of combination_lock 3's do, but 240 of the 52488 (layout, image) pairs of
+holey 1 don't match. `symmetric=False` (--all) surveys every layout.
+
+The range is split into shards that are surveyed on separate processes, and results are appended as they come in to
+a folder of column files, one per field, that `load` maps back as NumPy arrays.
+"""
+
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+from atomic import atomic_write
+from batch import BatchSolver, layouts_to_strings
+from scorer import accumulator
+from templater import get_template, Candidate
+
+CHARS = numpy.frombuffer(b'.*?', dtype=numpy.uint8)
+
+# name -> dtype of each column file, in the order records are written
+COLUMNS = dict(
+  index='<u8',  # the layout, as a number
+  weight='<u1',  # how many layouts it stands for, itself included
+  score='<f8',
+  rounds='<u2',
+)
+
+
+def to_layouts(indexes, length):
+  """(layouts x length) characters of each layout number"""
+  powers = 3 ** numpy.arange(length - 1, -1, -1, dtype=numpy.int64)
+  return CHARS[(indexes[:, None] // powers) % 3]
+
+
+def canonical(indexes, length, perms):
+  """For each layout number, whether it's the smallest of its symmetric images, and how many distinct images it has"""
+  powers = 3 ** numpy.arange(length - 1, -1, -1, dtype=numpy.int64)
+  digits = (indexes[:, None] // powers) % 3
+  images = numpy.stack([digits[:, perm] @ powers for perm in perms], axis=1)
+
+  ordered = numpy.sort(images, axis=1)
+  distinct = 1 + (ordered[:, 1:] != ordered[:, :-1]).sum(axis=1)
+  return indexes == ordered[:, 0], distinct
+
+
+def survey_shard(template_method, template_args, score_method, start, end, symmetric=True, max_inexact_stages=1):
+  """
+  Surveys layouts start .. end - 1, returning the columns for the ones kept, each one's steps, and how many were
+  skipped for symmetry and for failing the sanity check
+  """
+  template = get_template(template_method, *template_args)
+  length = template.num
+
+  indexes = numpy.arange(start, end, dtype=numpy.int64)
+  symmetries = template.symmetries() if symmetric else template.symmetries()[:1]
+  kept, weights = canonical(indexes, length, [list(perm) for perm, _ in symmetries])
+  mirrored = int((~kept).sum())
+  indexes, weights = indexes[kept], weights[kept]
+
+  layouts = to_layouts(indexes, length)
+  if template.sanity_checks is not None:
+    sane = template.sanity_checks(layouts)
+  else:
+    sane = numpy.array([template.sanity_check(layout) for layout in layouts_to_strings(layouts)], dtype=bool)
+  insane = int((~sane).sum())
+  indexes, weights, layouts = indexes[sane], weights[sane], layouts[sane]
+
+  if len(layouts) > 1:
+    results = BatchSolver(template, max_inexact_stages).solve(layouts)
+  else:
+    results = [Candidate(template, compressed).puzzle(max_inexact_stages=max_inexact_stages).solve()
+               for compressed in layouts_to_strings(layouts)]
+
+  scores = []
+  steps = []
+  for result in results:
+    scorer = accumulator(score_method).feed(result['summary'])
+    scores.append(scorer.score(result['solved']))
+    steps.append(scorer.steps)
+
+  columns = dict(
+    index=indexes,
+    weight=weights,
+    score=numpy.array(scores, dtype=float),
+    rounds=numpy.array([len(step) for step in steps]),
+  )
+  return columns, steps, mirrored, insane
+
+
+class SurveyWriter(object):
+  """
+  Writes survey records to a new folder of column files (see COLUMNS), plus steps.txt with one line per record. Any
+  survey already in the folder is only overwritten with force. meta.json is written from the start and updated after
+  every append, so a survey that's cut short still describes the records it has; `finished` says whether it was.
+  """
+
+  def __init__(self, folder, meta, force=False):
+    if not force and any(os.path.exists(os.path.join(folder, name)) for name in ['meta.json', 'steps.txt']):
+      raise FileExistsError(f'{folder} already has a survey in it')
+
+    os.makedirs(folder, exist_ok=True)
+    self.folder = folder
+    self.meta = dict(meta, columns=COLUMNS, records=0, finished=False)
+    self.files = {name: open(os.path.join(folder, name + '.bin'), 'wb') for name in COLUMNS}
+    self.steps = open(os.path.join(folder, 'steps.txt'), 'w')
+    self.save_meta()
+
+  def save_meta(self):
+    atomic_write(os.path.join(self.folder, 'meta.json'), lambda f: json.dump(self.meta, f, indent=2))
+
+  def append(self, columns, steps):
+    for name, dtype in COLUMNS.items():
+      self.files[name].write(numpy.asarray(columns[name]).astype(dtype).tobytes())
+      self.files[name].flush()
+
+    self.steps.write(''.join(step + '\n' for step in steps))
+    self.steps.flush()
+    self.meta['records'] += len(steps)
+    self.save_meta()
+
+  def close(self):
+    for f in self.files.values():
+      f.close()
+    self.steps.close()
+    self.save_meta()
+
+
+def load(folder):
+  """A survey's meta.json and its columns, memory-mapped"""
+  with open(os.path.join(folder, 'meta.json')) as f:
+    meta = json.load(f)
+
+  columns = dict()
+  for name, dtype in meta['columns'].items():
+    filename = os.path.join(folder, name + '.bin')
+    columns[name] = numpy.memmap(filename, dtype=dtype, mode='r') if meta['records'] else numpy.zeros(0, dtype=dtype)
+
+  return meta, columns
+
+
+def layout(number, length):
+  return to_layouts(numpy.array([number], dtype=numpy.int64), length)[0].tobytes().decode('ascii')
+
+
+def survey(template_method, template_args, score_method='seqnum', workers=1, shard_size=2 ** 16, folder=None,
+           symmetric=True, force=False):
+  template = get_template(template_method, *template_args)
+  total = 3 ** template.num
+  folder = folder or 'survey_{}_{}'.format(template_method, '_'.join(map(str, template_args)))
+  writer = SurveyWriter(folder, dict(
+    template=template_method,
+    args=list(template_args),
+    score_method=score_method,
+    cells=template.num,
+    layouts=total,
+    symmetries=len(template.symmetries()) if symmetric else 1,
+  ), force)
+
+  shards = [(start, min(total, start + shard_size)) for start in range(0, total, shard_size)]
+  skipped = dict(symmetric=0, insane=0)
+
+  try:
+    with ProcessPoolExecutor(workers) as pool:
+      jobs = pool.map(
+        survey_shard,
+        *zip(*[(template_method, template_args, score_method, start, end, symmetric) for start, end in shards]),
+      )
+
+      for number, (columns, steps, mirrored, insane) in enumerate(jobs):
+        skipped['symmetric'] += mirrored
+        skipped['insane'] += insane
+        writer.meta.update(skipped)
+        writer.append(columns, steps)
+        print(f'shard {number + 1}/{len(shards)}: {writer.meta["records"]} solved, {skipped["symmetric"]} skipped '
+              f'for symmetry, {skipped["insane"]} for sanity')
+
+    writer.meta['finished'] = True
+  finally:
+    writer.close()
+
+  return folder
+
+
+def hardest(folder, k=10):
+  """The k highest-scoring layouts in a survey, as (layout, score, steps, weight)"""
+  meta, columns = load(folder)
+  best = numpy.argsort(-columns['score'], kind='stable')[:k]
+
+  wanted = {int(row): None for row in best}
+  with open(os.path.join(folder, 'steps.txt')) as f:
+    for row, line in enumerate(f):
+      if row in wanted:
+        wanted[row] = line.strip()
+
+  return [(layout(int(columns['index'][row]), meta['cells']), float(columns['score'][row]), wanted[int(row)],
+           int(columns['weight'][row])) for row in best]
+
+
+# python survey.py <template_name> <size> [--score METHOD] [--workers N] [--shard-size N] [--output FOLDER] [--top K]
+#   [--all] [--force]
+# solves every layout of a template (see the top of this file) and prints the K hardest; with no template given,
+# the --top K hardest of an existing survey folder (--output) are printed instead
+# an existing survey in the output folder is only overwritten with --force
+# combination_lock 3 takes a few seconds, 4 is 43M layouts before symmetry and the sanity check
+
+if __name__ == '__main__':
+  parser = argparse.ArgumentParser()
+  parser.add_argument('template_method', nargs='?')
+  parser.add_argument('template_args', nargs='*', type=int)
+  parser.add_argument('--score', default='seqnum', help='scoring method, from scorer.py')
+  parser.add_argument('--workers', type=int, default=os.cpu_count(), help='number of processes to survey on')
+  parser.add_argument('--shard-size', type=int, default=2 ** 16, help='layouts per shard')
+  parser.add_argument('--output', help='folder to write the survey to (or read it from)')
+  parser.add_argument('--top', type=int, default=10, help='number of hardest layouts to print')
+  parser.add_argument('--all', action='store_true', help='survey every layout, not one per set of symmetric ones')
+  parser.add_argument('--force', action='store_true', help='overwrite a survey already in the output folder')
+  options = parser.parse_args()
+
+  folder = options.output
+  if options.template_method:
+    try:
+      folder = survey(options.template_method, tuple(options.template_args), options.score, options.workers,
+                      options.shard_size, folder, not options.all, options.force)
+    except FileExistsError as e:
+      parser.error(f'{e} (use --force to overwrite it)')
+  elif not folder:
+    parser.error('give a template to survey or an --output folder to read')
+
+  for compressed, scored, steps, weight in hardest(folder, options.top):
+    print(f'{compressed} with score {scored} and steps {steps} (x{weight})')
@@ -1,7 +1,14 @@
-from functools import partial
-from solver import Puzzle
+import math
+from functools import partial, lru_cache
+from cellsets import popcount, bits, from_cells
+from solver import Puzzle, MaskPuzzle
 from scorer import score
-from loader import load, extract
+from loader import load, read
+
+try:
+  import numpy
+except ImportError:
+  numpy = None
 
 
 def combination_lock(size):
@@ -41,61 +48,64 @@ def combination_lock(size):
 
     return 0 in h or 0 in v or size in h or size in v
 
+  def sanity_checks(layouts):  # takes a (candidates x cells) array of compressed strings' characters
+    mines = (layouts == ord('*')).reshape(-1, size, size)
+    h, v = mines.sum(axis=2), mines.sum(axis=1)
+    return ((h == 0) | (v == 0) | (h == size) | (v == size)).any(axis=1)
+
   return dict(
     num=size ** 2,
     board=board,
     revealed=revealed,
     constraints=constraints,
     sanity_check=sanity_check,
+    sanity_checks=sanity_checks,
   )
 
 
-def combination_lock_render(compressed, size):
-  num, board, revealed, constraints, _ = combination_lock(size)
+def combination_lock_render(compressed, size, scored=None):
+  data = make_template('combination_lock', size)
+  num, board, revealed, constraints = data['num'], data['board'], data['revealed'], data['constraints']
+  replace_cells(board, revealed, constraints, compressed)
 
   tile_size = 10
   points = '-{s},-{s},{s},-{s},{s},{s},-{s},{s}'.format(s=0.96 * tile_size / 2)
 
-  nodes = []
   columns = []
 
-  for i in range(num):
-    board[i][1] = compressed[i]
-    nodes.append(dict(
-      id=i,
-      neighbors=board[i][2],
-      position=((i % size) * tile_size, (i // size) * tile_size),
-      has_mine=compressed[i] == '*',
-      secret=compressed[i] == '?',
-      points=points,
-    ))
+  def nodes():  # made one at a time as the level is written out, rather than all up front
+    for i in range(num):
+      yield dict(
+        id=i,
+        neighbors=board[i][2],
+        position=((i % size) * tile_size, (i // size) * tile_size),
+        has_mine=compressed[i] == '*',
+        secret=compressed[i] == '?',
+        points=points,
+      )
 
   for j in range(size):
     # horizontal column hints
-    constraints[2 * j][0] = sum([compressed[i] == '*' for i in constraints[2 * j][1]])
     columns.append(dict(
       ids=constraints[2 * j][1],
       text_location=(-tile_size, j * tile_size),
     ))
 
     # vertical column hints
-    constraints[2 * j + 1][0] = sum([compressed[i] == '*' for i in constraints[2 * j + 1][1]])
     columns.append(dict(
       ids=constraints[2 * j + 1][1],
       text_location=(j * tile_size, -tile_size),
     ))
 
-  constraints[-1][0] = compressed.count('*')
-
-  result = Puzzle(board, revealed, constraints).solve()
-  scored = score(result, 'seqnum')
+  if scored is None:  # not already known from generating it (Puzzle sorts the board, which nodes still needs as is)
+    scored = score(Puzzle(sorted(board), revealed, constraints).solve(), 'seqnum')
   title = f'Combination Lock {size}x{size} with score {scored}'
   tile_text = 'CLX'
 
   return dict(
     title=title,
     tile_text=tile_text,
-    nodes=nodes,
+    nodes=nodes(),
     columns=columns,
     scored=scored,
   )
@@ -132,62 +142,63 @@ def cl_corner_bite(size):
   def sanity_check(compressed):  # takes a compressed string
     return compressed[0] == '.'
 
+  def sanity_checks(layouts):  # takes a (candidates x cells) array of compressed strings' characters
+    return layouts[:, 0] == ord('.')
+
   return dict(
     num=size ** 2,
     board=board,
     revealed=revealed,
     constraints=constraints,
     sanity_check=sanity_check,
+    sanity_checks=sanity_checks,
   )
 
 
-def cl_corner_bite_render(compressed, size):
-  num, board, revealed, constraints, _ = cl_corner_bite(size)
+def cl_corner_bite_render(compressed, size, scored=None):
+  data = make_template('cl_corner_bite', size)
+  num, board, revealed, constraints = data['num'], data['board'], data['revealed'], data['constraints']
+  replace_cells(board, revealed, constraints, compressed)
 
   tile_size = 10
   points = '-{s},-{s},{s},-{s},{s},{s},-{s},{s}'.format(s=0.96 * tile_size / 2)
 
-  nodes = []
   columns = []
 
-  for i in range(num):
-    board[i][1] = compressed[i]
-    nodes.append(dict(
-      id=i,
-      neighbors=board[i][2],
-      position=((i % size) * tile_size, (i // size) * tile_size),
-      has_mine=compressed[i] == '*',
-      secret=compressed[i] == '?',
-      revealed=i in revealed,
-      points=points,
-    ))
+  def nodes():  # made one at a time as the level is written out, rather than all up front
+    for i in range(num):
+      yield dict(
+        id=i,
+        neighbors=board[i][2],
+        position=((i % size) * tile_size, (i // size) * tile_size),
+        has_mine=compressed[i] == '*',
+        secret=compressed[i] == '?',
+        revealed=i in revealed,
+        points=points,
+      )
 
   for j in range(size):
     # horizontal column hints
-    constraints[2 * j][0] = sum([compressed[i] == '*' for i in constraints[2 * j][1]])
     columns.append(dict(
       ids=constraints[2 * j][1],
       text_location=(-tile_size, j * tile_size),
     ))
 
     # vertical column hints
-    constraints[2 * j + 1][0] = sum([compressed[i] == '*' for i in constraints[2 * j + 1][1]])
     columns.append(dict(
       ids=constraints[2 * j + 1][1],
       text_location=(j * tile_size, -tile_size),
     ))
 
-  constraints[-1][0] = compressed.count('*')
-
-  result = Puzzle(board, revealed, constraints).solve()
-  scored = score(result, 'seqnum')
+  if scored is None:  # not already known from generating it (Puzzle sorts the board, which nodes still needs as is)
+    scored = score(Puzzle(sorted(board), revealed, constraints).solve(), 'seqnum')
   title = f'CL Corner Bite {size}x{size} with score {scored}'
   tile_text = 'CoB'
 
   return dict(
     title=title,
     tile_text=tile_text,
-    nodes=nodes,
+    nodes=nodes(),
     columns=columns,
     scored=scored,
   )
@@ -241,6 +252,9 @@ def holey(size):
   def sanity_check(compressed):  # takes a compressed string
     return True
 
+  def sanity_checks(layouts):  # takes a (candidates x cells) array of compressed strings' characters
+    return numpy.ones(len(layouts), dtype=bool)
+
   num = size ** 2 - (size // 2) ** 2
   return dict(
     num=num,
@@ -248,61 +262,56 @@ def holey(size):
     revealed=revealed,
     constraints=constraints,
     sanity_check=sanity_check,
+    sanity_checks=sanity_checks,
   )
 
 
-def holey_render(compressed, size):
-  num, board, revealed, constraints, _ = holey(size)
+def holey_render(compressed, size, scored=None):
+  data = make_template('holey', size)
+  board, revealed, constraints = data['board'], data['revealed'], data['constraints']
+  replace_cells(board, revealed, constraints, compressed)
   size = 2 * size + 1
 
   tile_size = 10
   points = '-{s},-{s},{s},-{s},{s},{s},-{s},{s}'.format(s=0.96 * tile_size / 2)
 
-  nodes = []
   columns = []
-  mapped = dict()
 
-  for i in range(size ** 2):
-    c = compressed[i] if i < len(compressed) else '.'
-    board[i][1] = c
-    mapped[board[i][0]] = c
-
-    nodes.append(dict(
-      id=board[i][0],
-      neighbors=board[i][2],
-      position=((board[i][0] % size) * tile_size, (board[i][0] // size) * tile_size),
-      has_mine=c == '*',
-      secret=c == '?',
-      revealed=board[i][0] in revealed,
-      points=points,
-    ))
+  def nodes():  # made one at a time as the level is written out, rather than all up front
+    for i in range(size ** 2):
+      c = board[i][1]
+      yield dict(
+        id=board[i][0],
+        neighbors=board[i][2],
+        position=((board[i][0] % size) * tile_size, (board[i][0] // size) * tile_size),
+        has_mine=c == '*',
+        secret=c == '?',
+        revealed=board[i][0] in revealed,
+        points=points,
+      )
 
   for j in range(size // 2 + 1):
     # horizontal column hints
-    constraints[2 * j][0] = sum([mapped[i] == '*' for i in constraints[2 * j][1]])
     columns.append(dict(
       ids=constraints[2 * j][1],
       text_location=(-tile_size, 2 * j * tile_size),
     ))
 
     # vertical column hints
-    constraints[2 * j + 1][0] = sum([mapped[i] == '*' for i in constraints[2 * j + 1][1]])
     columns.append(dict(
       ids=constraints[2 * j + 1][1],
       text_location=(2 * j * tile_size, -tile_size),
     ))
 
-  constraints[-1][0] = compressed.count('*')
-
-  result = Puzzle(board, revealed, constraints).solve()
-  scored = score(result, 'seqnum')
+  if scored is None:  # not already known from generating it (Puzzle sorts the board, which nodes still needs as is)
+    scored = score(Puzzle(sorted(board), revealed, constraints).solve(), 'seqnum')
   title = f'Holey {size}x{size} with score {scored}'
   tile_text = 'HOL'
 
   return dict(
     title=title,
     tile_text=tile_text,
-    nodes=nodes,
+    nodes=nodes(),
     columns=columns,
     scored=scored,
   )
@@ -441,12 +450,11 @@ def L_shape_grid(compressed, size, depth):
     )
 
 
-def clone(compressed, filename):
-  contents = None
+def clone(compressed, filename, scored=None):
   with open(filename) as f:
-    contents = f.read()
+    data = read(f)
 
-  puzzle, name, reverse_id_map = load(contents)
+  puzzle, name, reverse_id_map = load(data)
   board = puzzle.board
   revealed = puzzle.revealed
   constraints = puzzle.og_constraints
@@ -463,13 +471,11 @@ def clone(compressed, filename):
     )
   else:
     replace_cells(board, revealed, constraints, compressed)
-    puzzle = Puzzle(board, revealed, constraints)
-    result = puzzle.solve()
-    scored = score(result, 'seqnum')
+    if scored is None:
+      scored = score(Puzzle(board, revealed, constraints).solve(), 'seqnum')
     title = f'Cloned "{name}" with score {scored}'
     tile_text = 'CLO'
 
-    data = extract(contents)
     num_revealed = 0
     for index, node in enumerate(data['nodes']):
       if index in revealed:
@@ -502,16 +508,210 @@ def replace_cells(board, revealed, constraints, compressed):
     constraint[0] = sum([mapped[i] == '*' for i in constraint[1]])
 
 
-def make_template(method, *args, **kwargs):
+SURVEY_ORDER = str.maketrans('.*?', '012')
+
+
+def transform(compressed, perm):
+  """compressed with its characters moved around by perm, one of a Template's symmetries"""
+  return ''.join([compressed[position] for position in perm])
+
+
+class Template(object):
+  """
+  Everything about a template that doesn't depend on the mine layout: its cells and their neighbors, the cells of
+  each constraint, and which cells start out revealed, along with bitmasks and an id map precomputed from them.
+
+  These are built once per (method, args) by get_template and shared from then on, so they're never changed after
+  __init__. make_template hands out fresh copies of the parts that candidates get written into.
+  """
+
+  def __init__(self, data):
+    self.num = data['num']
+    self.board = tuple((tile_id, what, tuple(neighbors)) for tile_id, what, neighbors in data['board'])
+    self.revealed = tuple(data['revealed'])
+    self.counts = tuple(count for count, _ in data['constraints'])
+    self.constraints = tuple(tuple(cells) for _, cells in data['constraints'])
+    self.sanity_check = data.get('sanity_check', None)
+    self.sanity_checks = data.get('sanity_checks', None) if numpy is not None else None  # sanity_check, vectorized
+
+    self.id_map = {tile_id: index for index, (tile_id, _, _) in enumerate(self.board)}
+    self.neighbor_masks = {tile_id: from_cells(neighbors) for tile_id, _, neighbors in self.board}
+    self.constraint_masks = tuple(from_cells(cells) for cells in self.constraints)
+    self.revealed_mask = from_cells(self.revealed)
+
+    # what Candidate and MaskPuzzle work from: the bit of each board row, neighbors by bit, and constraints without
+    # the revealed cells (which is how Puzzle sees them)
+    self.bits = tuple(1 << tile_id for tile_id, _, _ in self.board)
+    self.neighbor_bits = {1 << tile_id: mask for tile_id, mask in self.neighbor_masks.items()}
+    self.open_constraint_masks = tuple(mask & ~self.revealed_mask for mask in self.constraint_masks)
+    self.uncovered = dict()
+    self.automorphisms = None  # see symmetries
+
+    # each unrevealed cell's bit -> the constraints it's counted in, for Candidate.change
+    self.cell_constraints = {bit: [] for bit in self.bits if not bit & self.revealed_mask}
+    for index, mask in enumerate(self.open_constraint_masks):
+      for bit in bits(mask):
+        self.cell_constraints.setdefault(bit, []).append(index)
+
+  def instantiate(self):
+    data = dict(
+      num=self.num,
+      board=[[tile_id, what, list(neighbors)] for tile_id, what, neighbors in self.board],
+      revealed=list(self.revealed),
+      constraints=[[count, list(cells)] for count, cells in zip(self.counts, self.constraints)],
+      template=self,
+    )
+
+    if self.sanity_check is not None:
+      data['sanity_check'] = self.sanity_check
+
+    if self.sanity_checks is not None:
+      data['sanity_checks'] = self.sanity_checks
+
+    return data
+
+  def symmetries(self):
+    """
+    The rotations and reflections of the template's grid that map it onto itself (its cells, their neighbors, the
+    constraints and the revealed cells), identity first, as (perm, cells) pairs: position k of a transformed compressed
+    string is position perm[k] of the original (see transform), and cells maps each cell id of the original to its id
+    in the transformed one. Templates that aren't a whole square grid (cell ids x + size * y) only get the identity.
+    """
+    if self.automorphisms is not None:
+      return self.automorphisms
+
+    ids = [tile_id for tile_id, _, _ in self.board]
+    self.automorphisms = [(tuple(range(self.num)), {tile_id: tile_id for tile_id in ids})]
+
+    size = math.isqrt(len(ids))
+    if sorted(ids) != list(range(size * size)):
+      return self.automorphisms
+
+    neighbors = {tile_id: set(cells) for tile_id, _, cells in self.board}
+    constraints = sorted(sorted(cells) for cells in self.constraints)
+    revealed = set(self.revealed)
+
+    last = size - 1
+    transforms = [
+      lambda x, y: (last - y, x),
+      lambda x, y: (last - x, last - y),
+      lambda x, y: (y, last - x),
+      lambda x, y: (last - x, y),
+      lambda x, y: (x, last - y),
+      lambda x, y: (y, x),
+      lambda x, y: (last - y, last - x),
+    ]
+
+    for transform in transforms:
+      moved = {tile_id: transform(tile_id % size, tile_id // size) for tile_id in ids}
+      moved = {tile_id: x + size * y for tile_id, (x, y) in moved.items()}
+
+      if ({moved[cell] for cell in revealed} != revealed
+          or any({moved[cell] for cell in neighbors[tile_id]} != neighbors[moved[tile_id]] for tile_id in ids)
+          or sorted(sorted(moved[cell] for cell in cells) for cells in constraints) != constraints):
+        continue
+
+      perm = tuple(self.id_map[moved[ids[position]]] for position in range(self.num))
+      if all(position < self.num for position in perm) and perm not in [known for known, _ in self.automorphisms]:
+        self.automorphisms.append((perm, {moved[tile_id]: tile_id for tile_id in ids}))
+
+    return self.automorphisms
+
+  def canonical(self, compressed):
+    """
+    The one of compressed and its symmetric images that comes first in survey order ('.' < '*' < '?', see survey.py),
+    so that all of them have the same canonical form
+    """
+    symmetries = self.symmetries()
+    if len(symmetries) == 1:
+      return compressed
+
+    return min((transform(compressed, perm) for perm, _ in symmetries), key=lambda image: image.translate(SURVEY_ORDER))
+
+  def uncovered_masks(self, length):
+    """The '*' and '.' cells among the board rows past the first length, which compressed strings don't cover"""
+    if length not in self.uncovered:
+      mines = clear = 0
+      for bit, (_, what, _) in zip(self.bits[length:], self.board[length:]):
+        if what == '*':
+          mines |= bit
+        elif what == '.':
+          clear |= bit
+
+      self.uncovered[length] = (mines, clear)
+
+    return self.uncovered[length]
+
+
+class Candidate(object):
+  """
+  A compressed string applied to a Template, kept as bitmasks of its '*' and '.' cells plus each constraint's count.
+
+  This is what replace_cells does to a template's board and constraints, except nothing of the template's gets
+  changed and nothing is allocated per cell, and `puzzle` hands it to the solver as a MaskPuzzle.
+  """
+
+  def __init__(self, template, compressed):
+    self.template = template
+    self.compressed = compressed
+
+    mines, clear = template.uncovered_masks(len(compressed))
+    for bit, what in zip(template.bits, compressed):
+      if what == '*':
+        mines |= bit
+      elif what == '.':
+        clear |= bit
+
+    self.mines = mines
+    self.clear = clear
+    counted = mines & ~template.revealed_mask  # replace_cells counts revealed cells as '.'
+    self.counts = [popcount(mask & counted) for mask in template.constraint_masks]
+
+  def change(self, index, what):
+    """
+    Returns a copy of this candidate with the cell at index of the compressed string changed to what. Only the counts
+    of the constraints that cell is in get touched, and its neighbors' hints are worked out from the masks anyway.
+    """
+    template = self.template
+    bit = template.bits[index]
+    old = self.compressed[index]
+
+    variant = Candidate.__new__(Candidate)
+    variant.template = template
+    variant.compressed = self.compressed[:index] + what + self.compressed[index + 1:]
+    variant.mines = self.mines & ~bit | (bit if what == '*' else 0)
+    variant.clear = self.clear & ~bit | (bit if what == '.' else 0)
+    variant.counts = self.counts
+
+    if (old == '*') != (what == '*') and not bit & template.revealed_mask:
+      step = 1 if what == '*' else -1
+      variant.counts = self.counts[:]
+      for constraint in template.cell_constraints[bit]:
+        variant.counts[constraint] += step
+
+    return variant
+
+  def puzzle(self, **kwargs):
+    template = self.template
+    constraints = list(zip(template.open_constraint_masks, self.counts))
+    return MaskPuzzle(template.neighbor_bits, self.mines, self.clear, template.revealed, constraints, **kwargs)
+
+
+@lru_cache(maxsize=None)
+def get_template(method, *args, **kwargs):
   methods = dict(
     combination_lock=combination_lock,
     cl_corner_bite=cl_corner_bite,
     holey=holey,
     l_shape_grid=partial(L_shape_grid, None),
-    clone=partial(clone, None),
+    clone=partial(clone, None),  # so a cloned file is only read once per process
   )
 
-  return methods[method](*args, **kwargs)
+  return Template(methods[method](*args, **kwargs))
+
+
+def make_template(method, *args, **kwargs):
+  return get_template(method, *args, **kwargs).instantiate()
 
 
 def render_template(method, compressed, *args, **kwargs):
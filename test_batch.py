@@ -0,0 +1,40 @@
+import random
+
+from batch import BatchSolver, layouts_to_array
+from scorer import accumulator
+from templater import get_template, Candidate
+
+
+def summarize(result):
+  steps = accumulator('seqnum').feed(result['summary']).steps
+  trivial = [dict(step['trivial']) for step in result['summary'] if 'trivial' in step]
+  return result['solved'], result.get('pruned', False), result.mask('revealed'), result.mask('flagged'), steps, trivial
+
+
+def check_parity(template_method, *template_args, count=300, max_rounds=None):
+  template = get_template(template_method, *template_args)
+  rng = random.Random(0)
+  # whole-board layouts, so the revealed cells get '*'s and '?'s too
+  layouts = [''.join(rng.choice('.*?') for _ in range(template.num)) for _ in range(count)]
+  layouts.append('*....??..*.??*?**.*.....?' if template_method == 'cl_corner_bite' else layouts[0])
+
+  results = BatchSolver(template, max_inexact_stages=1, max_rounds=max_rounds).solve(layouts_to_array(layouts))
+  for layout, result in zip(layouts, results):
+    expected = Candidate(template, layout).puzzle(max_inexact_stages=1, max_rounds=max_rounds).solve()
+    assert summarize(result) == summarize(expected), layout
+
+
+def test_parity_combination_lock():
+  check_parity('combination_lock', 5, count=100)
+
+
+def test_parity_cl_corner_bite():
+  check_parity('cl_corner_bite', 5, count=200)
+
+
+def test_parity_holey():
+  check_parity('holey', 2, count=60)
+
+
+def test_parity_max_rounds():
+  check_parity('cl_corner_bite', 5, count=200, max_rounds=3)
@@ -0,0 +1,16 @@
+from generator import score_candidate
+from scorer import score
+from templater import get_template, Candidate
+
+
+# a combination lock 5 layout whose solve gets stuck on a step that used no inequalities at all
+stuck = '*..**..*?.*.?*?.??..?..*.'
+
+
+def test_lognum_unsolvable():
+  candidate = Candidate(get_template('combination_lock', 5), stuck)
+  result = candidate.puzzle().solve()
+
+  assert not result['solved']
+  assert score(result, 'lognum') == -1
+  assert score_candidate(candidate, 'lognum')[0] == -1
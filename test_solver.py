@@ -0,0 +1,25 @@
+import random
+
+from generator import score_candidate
+from templater import get_template, Candidate
+
+
+def test_resolve_matches_solve():
+  template = get_template('combination_lock', 5)
+  rng = random.Random(0)
+  compressed = template.num - len(template.revealed)
+
+  for _ in range(5):
+    base = ''.join(rng.choice('..*?') for _ in range(compressed))
+    candidate = Candidate(template, base)
+    _, previous = score_candidate(candidate, 'seqnum', checkpoint=True)
+
+    for index in range(compressed):
+      for char in '.*?':
+        if char == base[index]:
+          continue
+
+        variant = base[:index] + char + base[index + 1:]
+        expected = score_candidate(Candidate(template, variant), 'seqnum')
+        scored = score_candidate(candidate.change(index, char), 'seqnum', previous=previous, changed=index)
+        assert scored[0] == expected[0] and scored[1]['steps'] == expected[1]['steps'], variant
@@ -1,5 +1,7 @@
 import sys
 import json
+from collections.abc import Mapping
+
 from loader import load
 
 
@@ -8,6 +10,9 @@ class CustomEncoder(json.JSONEncoder):
     if isinstance(obj, set):
       return list(obj)
 
+    if isinstance(obj, Mapping):  # solver results and their trivial steps, see cellsets.LazyCells
+      return dict(obj)
+
     # fallback for all other cases
     return json.JSONEncoder.default(self, obj)
 
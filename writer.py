@@ -1,9 +1,14 @@
+import io
 import re
 import sys
-import time
+import hashlib
+import argparse
 import datetime
+import zipfile
 from jinja2 import Environment, FileSystemLoader, select_autoescape
 
+import results
+from atomic import atomic_write
 from templater import render_template
 
 # Jinja2 setup stuff
@@ -17,7 +22,22 @@ level_template = env.get_template('leveltemplate.xml')
 # this is a generic file that captures the overall structure of a Tametsi puzzle file
 
 
-def write_level(board_template, compressed, *template_args, **parameters):
+def puzzle_id(board_template, template_args, compressed):
+  """
+  The level's Tametsi ID, which has to be unique, otherwise Tametsi gets confused. It's a hash of what the level is made
+  of, so any number of processes can hand them out at once without ever handing out the same one for different levels,
+  and writing the same level again gives it the same ID.
+  """
+  made_of = repr((board_template, list(template_args), compressed))
+  return hashlib.sha256(made_of.encode('utf-8')).hexdigest()[:16]
+
+
+def render_level(board_template, compressed, *template_args, scored=None, **parameters):
+  """
+  Returns the level's filename (see level_filename) and its puzzle file's contents, as pieces that are only rendered as
+  they're written out, so no level is ever held in memory all at once. Given the score it's already known to have, it
+  isn't solved again.
+  """
   # default but overwritable attributes
   params = dict(
     tile_size=10,
@@ -26,9 +46,9 @@ def write_level(board_template, compressed, *template_args, **parameters):
 
   # render_template takes a template (actually the lookup name) that then gets instantiated
   # according to the compressed string (and any extra args like size) and returns its attributes
-  # this does solve the ensuing puzzle in order to give its score
-  params = render_template(board_template, compressed, *template_args)
-  params['puzzle_id'] = int(time.time())  # there's probably a better way to do this but ids need to be unique, otherwise Tametsi gets confused
+  # this does solve the ensuing puzzle in order to give its score, unless that's passed in as scored
+  params = render_template(board_template, compressed, *template_args, scored=scored)
+  params['puzzle_id'] = puzzle_id(board_template, template_args, compressed)
 
   # params['nodes'] = describes the cells and their relations with each other
   # params['columns'] = groups some cells into some number of column hints (in any direction, including horizontal and diagonal) [technically *any* set of cells]
@@ -37,33 +57,120 @@ def write_level(board_template, compressed, *template_args, **parameters):
   # params['tile_text'] = this is displayed in-game while choosing a puzzle
   # params['score'] = the computed score of the puzzle
 
-  # Jinja-render the template file with this info
-  level = level_template.render(**params)
+  # Jinja-render the template file with this info, a bit at a time
+  return level_filename(params['title'], params['puzzle_id']), level_template.generate(**params)
 
-  # vvv This just makes a unique filename
+
+def level_filename(title, level_id):
+  # vvv This just makes a unique filename: levels can share a title (and a day), but not an id
   today = datetime.datetime.strftime(datetime.datetime.now(), '%Y%m%d')
-  filename_safe_title = params['title'].replace(' ', '-').replace('"', '_')
+  filename_safe_title = title.replace(' ', '-').replace('"', '_')
+  return f'{today}_{filename_safe_title}_{level_id[:8]}.puz'
+
+
+def write_file(filename, pieces):
+  # written whole or not at all, so that nothing (Tametsi included) ever reads a half-written level
+  atomic_write(filename, lambda file: file.writelines(pieces))
 
-  name = f'puzzles/{today}_{filename_safe_title}.puz'
+
+def write_level(board_template, compressed, *template_args, **parameters):
+  name, level = render_level(board_template, compressed, *template_args, **parameters)
+
+  name = f'puzzles/{name}'
   print(name)
-  # ^^^
 
   # Write to the filename and also the latest file, for immediate testing
-  with open(name, 'w') as file:
-    file.write(level)
-
-  with open('latest.puz', 'w') as file:
-    file.write(level)
+  write_file(name, level)
+  with open(name) as file:
+    write_file('latest.puz', file)
+
+
+def read_records(logs, top=None, rescore=False):
+  """
+  Yields (template, args, compressed, score) for each distinct candidate in the result logs (see results.py), or just
+  the best top of each. score is None, so that the level gets solved again, with rescore or when it was logged with
+  another score method than the seqnum levels are titled with.
+  """
+  seen = set()
+
+  for filename in logs:
+    found = results.top(filename, top) if top else (record for record, _ in results.read(filename))
+
+    for record in found:
+      key = (record['template'], tuple(record['args']), record['candidate'])
+      if key in seen:
+        continue
+      seen.add(key)
+
+      trusted = not rescore and record.get('score_method') == 'seqnum'
+      yield record['template'], record['args'], record['candidate'], record['score'] if trusted else None
+
+
+def write_levels(records, archive=None):
+  """
+  Writes a level for each (template, args, compressed, score) in records, in this one process, to /puzzles or into the
+  zip file archive, and the last of them to latest.puz. A score that isn't None is trusted rather than solved for.
+  Levels already in the archive (by name, so the same layout written the same day) are left as they are. Unlike
+  /puzzles, an archive can only have one writer at a time. Returns the number written.
+  """
+  count = 0
+  last = None
+  zipped = zipfile.ZipFile(archive, 'a', zipfile.ZIP_DEFLATED) if archive else None
+  archived = set(zipped.namelist()) if zipped is not None else set()
+
+  try:
+    for board_template, template_args, compressed, scored in records:
+      name, level = render_level(board_template, compressed, *template_args, scored=scored)
+
+      if zipped is not None:
+        if name in archived:
+          continue
+        archived.add(name)
+        with io.TextIOWrapper(zipped.open(name, 'w'), encoding='utf-8') as member:
+          member.writelines(level)
+        print(f'{archive}:{name}')
+      else:
+        write_file(f'puzzles/{name}', level)
+        print(f'puzzles/{name}')
+
+      last = name
+      count += 1
+
+    if last is not None:
+      opened = io.TextIOWrapper(zipped.open(last), encoding='utf-8') if zipped is not None else open(f'puzzles/{last}')
+      with opened as file:
+        write_file('latest.puz', file)
+  finally:
+    if zipped is not None:
+      zipped.close()
+
+  return count
 
 
 # python writer.py <template_name> <compressed> [arg1] [arg2] ...
 # <compressed> is a string of `.*?` that represent the cells as empty (.), mined (*), or unknown (?)
 
-if __name__ == '__main__':
-  # write_level('combination_lock', compressed, size)
-  # write_level('cl_corner_bite', compressed, size)
-  # write_level('holey', compressed, size)
-  # write_level('l_shape_grid', compressed, size, depth)
-  args = [int(arg) if re.match(r'\d+', arg) else arg for arg in sys.argv[1:]]
+# python writer.py --batch <log_file> [...] [--top K] [--zip FILE] [--rescore]
+# writes a level for every candidate in the given result logs (see results.py), or the K best of each, all in one go
+# the scores they were logged with are used as they are, unless --rescore is given
+# --zip adds them to an archive (like published/20181123_Combination-Lock-Set.zip) instead of writing them to /puzzles
 
-  write_level(*args)  # just pipes in the command line args
+if __name__ == '__main__':
+  if sys.argv[1:2] == ['--batch']:
+    parser = argparse.ArgumentParser(prog='writer.py --batch')
+    parser.add_argument('logs', nargs='+', help='result logs to write levels for')
+    parser.add_argument('--top', type=int, help='only write the K best distinct candidates of each log')
+    parser.add_argument('--zip', help='zip file to add the levels to, instead of /puzzles')
+    parser.add_argument('--rescore', action='store_true', help='solve each level again rather than trusting its logged score')
+    options = parser.parse_args(sys.argv[2:])
+
+    count = write_levels(read_records(options.logs, options.top, options.rescore), options.zip)
+    print(f'wrote {count} levels')
+  else:
+    # write_level('combination_lock', compressed, size)
+    # write_level('cl_corner_bite', compressed, size)
+    # write_level('holey', compressed, size)
+    # write_level('l_shape_grid', compressed, size, depth)
+    args = [int(arg) if re.match(r'\d+', arg) else arg for arg in sys.argv[1:]]
+
+    write_level(*args)  # just pipes in the command line args